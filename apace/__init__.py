@@ -28,9 +28,12 @@ from .classes import (
     Sextupole,
     Octupole,
     Lattice,
+    Parameters,
+    SequenceTable,
 )
-from .matrixmethod import MatrixMethod
+from .matrixmethod import MatrixMethod, MatrixCache
 from .twiss import Twiss
+from .batch import StabilityMap, stability_map, BatchTwiss, batch_twiss
 from .tracking_matrix import TrackingMatrix
 from .distributions import distribution
 from .utils import Signal
@@ -47,8 +50,15 @@ __all__ = [
     "Sextupole",
     "Octupole",
     "Lattice",
+    "Parameters",
+    "SequenceTable",
     "MatrixMethod",
+    "MatrixCache",
     "Twiss",
+    "StabilityMap",
+    "stability_map",
+    "BatchTwiss",
+    "batch_twiss",
     "distribution",
     "TrackingMatrix",
     "Signal",
@@ -0,0 +1,321 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+import numpy as np
+from scipy.integrate import trapz
+
+from .classes import Lattice, Quadrupole
+from .clib import twiss_product_batch
+from .matrixmethod import (
+    MatrixMethod,
+    IDENTITY,
+    MATRIX_SIZE,
+    drift_matrices,
+    quadrupole_matrices,
+)
+from .twiss import TWO_PI, CONST_Q, CONST_MEV_TO_GAMMA, poleface_effect
+
+BATCH_MAX_BYTES = 256 * 2 ** 20
+"""Default memory budget of the arrays of one chunk of :func:`batch_twiss`."""
+_DOUBLES_PER_STEP = MATRIX_SIZE ** 2 + 16
+"""Doubles per variant and step: the transfer matrix, k1, the Twiss parameter and
+temporary arrays."""
+
+
+class StabilityMap:
+    """Stability of a lattice on a grid of quadrupole strengths. Use
+    :func:`stability_map` to create it.
+
+    :param List[Quadrupole] elements: The varied quadrupoles.
+    :param List[np.ndarray] values: The k1 values of the quadrupoles.
+    :param np.ndarray one_turn_matrices: One-turn matrices on the grid. (..., 6, 6)
+    """
+
+    def __init__(self, elements, values, one_turn_matrices):
+        self.elements = elements
+        """The varied quadrupoles. The n-th quadrupole corresponds to the n-th axis."""
+        self.values = values
+        """The k1 values of the quadrupoles."""
+        m = np.moveaxis(one_turn_matrices, (-2, -1), (0, 1))
+        self.term_x = 2 - m[0, 0] ** 2 - 2 * m[0, 1] * m[1, 0] - m[1, 1] ** 2
+        """:attr:`Twiss.term_x` on the grid."""
+        self.term_y = 2 - m[2, 2] ** 2 - 2 * m[2, 3] * m[3, 2] - m[3, 3] ** 2
+        """:attr:`Twiss.term_y` on the grid."""
+        with np.errstate(invalid="ignore"):
+            self.tune_x_fractional = np.arccos((m[0, 0] + m[1, 1]) / 2) / TWO_PI
+            """Horizontal fractional tune on the grid. (NaN if unstable)"""
+            self.tune_y_fractional = np.arccos((m[2, 2] + m[3, 3]) / 2) / TWO_PI
+            """Vertical fractional tune on the grid. (NaN if unstable)"""
+
+    @property
+    def shape(self) -> tuple:
+        """Shape of the grid."""
+        return self.term_x.shape
+
+    @property
+    def stable_x(self) -> np.ndarray:
+        """Periodicity condition :attr:`term_x` > 0 on the grid."""
+        return self.term_x > 0
+
+    @property
+    def stable_y(self) -> np.ndarray:
+        """Periodicity condition :attr:`term_y` > 0 on the grid."""
+        return self.term_y > 0
+
+    @property
+    def stable(self) -> np.ndarray:
+        """Periodicity condition for both planes on the grid."""
+        return (self.term_x > 0) & (self.term_y > 0)
+
+
+def stability_map(lattice, parameters, n_threads=None) -> StabilityMap:
+    """Calculate the stability of a lattice on a grid of quadrupole strengths, without
+    changing the lattice or creating :class:`Twiss` objects.
+
+    The grid is spanned by the k1 values of all given quadrupoles (like `np.meshgrid`
+    with `indexing="ij"`). Only the matrices of the given quadrupoles are calculated
+    for each value and are broadcasted over the grid, while the transfer matrices of
+    all sub-lattices not containing them are calculated only once. The grid is split
+    into chunks, which are evaluated in parallel threads.
+
+    :param Lattice lattice: The lattice.
+    :param parameters: Maps quadrupoles (or their names) to arrays of k1 values.
+    :type parameters: Dict[Union[Quadrupole, str], array-like]
+    :param n_threads: Number of threads. Defaults to the number of cpu cores.
+    :type n_threads: int, optional
+    :return: The stability map.
+    :rtype: StabilityMap
+    """
+    if not parameters:
+        raise ValueError("At least one parameter is needed!")
+
+    elements, values = [], []
+    for key, value in parameters.items():
+        elements.append(_quadrupole(lattice, key))
+        values.append(np.asarray(value, dtype=float).ravel())
+
+    grid_shape = tuple(value.size for value in values)
+    n_dims = len(grid_shape)
+    element_matrices = {}
+    for axis, (element, value) in enumerate(zip(elements, values)):
+        shape = [1] * n_dims + [MATRIX_SIZE, MATRIX_SIZE]
+        shape[axis] = value.size
+        matrices = _quadrupole_matrices(value, element.length)
+        element_matrices[element] = matrices.reshape(shape)
+
+    # the fixed transfer matrices are calculated before the threads are started
+    varies, fixed = {}, {}
+    _collect_fixed(lattice, set(elements), varies, fixed, MatrixMethod(lattice))
+
+    def evaluate(indices):
+        chunk_matrices = element_matrices.copy()
+        first = elements[0]
+        chunk_matrices[first] = element_matrices[first][indices]
+        matrix = _batched_transfer_matrix(lattice, chunk_matrices, varies, fixed, {})
+        chunk_shape = (indices.size,) + grid_shape[1:] + (MATRIX_SIZE, MATRIX_SIZE)
+        return np.broadcast_to(matrix, chunk_shape)
+
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    chunks = np.array_split(np.arange(grid_shape[0]), min(n_threads, grid_shape[0]))
+    if len(chunks) == 1:
+        one_turn_matrices = evaluate(chunks[0])
+    else:
+        with ThreadPoolExecutor(n_threads) as executor:
+            one_turn_matrices = np.concatenate(list(executor.map(evaluate, chunks)))
+    return StabilityMap(elements, values, one_turn_matrices)
+
+
+class BatchTwiss:
+    """Twiss parameter of many variants of a lattice. Use :func:`batch_twiss` to
+    create it. The n-th entry of each array corresponds to the n-th variant. Values
+    of variants without a periodic solution are NaN.
+
+    :param int population: Number of variants.
+    :param int n_points: Number of points of the Twiss arrays or None.
+    """
+
+    def __init__(self, population, n_points=None):
+        self.stable = np.empty(population, dtype=bool)
+        """Whether there is a periodic solution for the variant."""
+        self.tune_x = np.empty(population)
+        """Horizontal tune."""
+        self.tune_y = np.empty(population)
+        """Vertical tune."""
+        self.chromaticity_x = np.empty(population)
+        """Natural horizontal chromaticity."""
+        self.chromaticity_y = np.empty(population)
+        """Natural vertical chromaticity."""
+        self.emittance_x = None
+        """Horizontal emittance. (Only if the energy is given)"""
+        self.beta_x = self.beta_y = self.eta_x = None
+        if n_points is not None:
+            self.beta_x = np.empty((population, n_points))
+            """Horizontal beta functions. (Only if `arrays` is set)"""
+            self.beta_y = np.empty((population, n_points))
+            """Vertical beta functions. (Only if `arrays` is set)"""
+            self.eta_x = np.empty((population, n_points))
+            """Horizontal dispersion functions. (Only if `arrays` is set)"""
+
+
+def batch_twiss(
+    lattice,
+    parameters,
+    values,
+    *,
+    arrays=False,
+    chunk_size=None,
+    max_bytes=BATCH_MAX_BYTES,
+    **kwargs,
+) -> BatchTwiss:
+    """Calculate the periodic Twiss parameter for a population of quadrupole
+    strengths without changing the lattice.
+
+    The transfer matrices of the base lattice are calculated once. For each chunk of
+    the population they are copied and only the steps of the varied quadrupoles are
+    replaced. Each variant of a chunk needs about 52 doubles per step, so the chunk
+    size is derived from `max_bytes` and the number of steps, unless it is given
+    explicitly. The variants of a chunk are distributed over multiple threads.
+
+    :param Lattice lattice: The base lattice.
+    :param parameters: The varied quadrupoles (or their names).
+    :type parameters: List[Union[Quadrupole, str]]
+    :param values: The k1 values of each variant. (population, n_params)
+    :type values: array-like
+    :param bool arrays: Also return the beta and dispersion functions. (Default=False)
+    :param chunk_size: Number of variants which are evaluated at once. Defaults to
+                       the largest chunk within `max_bytes` (at least one variant).
+    :type chunk_size: int, optional
+    :param int max_bytes: Memory budget of the arrays of one chunk, which is used to
+                          derive the chunk size. (Default=:data:`BATCH_MAX_BYTES`)
+    :param kwargs: Passed to the :class:`MatrixMethod`. (e.g. `energy`)
+    :return: The Twiss parameter of the variants.
+    :rtype: BatchTwiss
+    """
+    elements = [_quadrupole(lattice, key) for key in parameters]
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2 or values.shape[1] != len(elements):
+        raise ValueError(f"values must have the shape (population, {len(elements)})!")
+
+    matrix_method = MatrixMethod(lattice, **kwargs)
+    base_matrices = np.ascontiguousarray(matrix_method.matrices)
+    base_k1 = matrix_method.k1
+    k0 = matrix_method.k0
+    s = matrix_method.s
+    n_steps = matrix_method.n_steps
+    indices = [matrix_method.element_indices[element] for element in elements]
+    step_sizes = [matrix_method.step_size[index[0]] for index in indices]
+    has_energy = kwargs.get("energy") is not None
+    i2 = trapz(k0**2, s[1:])
+
+    population = values.shape[0]
+    if chunk_size is None:
+        chunk_size = max(1, max_bytes // (8 * _DOUBLES_PER_STEP * (n_steps + 1)))
+    result = BatchTwiss(population, n_steps + 1 if arrays else None)
+    if has_energy:
+        result.emittance_x = np.empty(population)
+
+    for start in range(0, population, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_values = values[chunk]
+        m = chunk_values.shape[0]
+        matrices = np.empty((m, n_steps, MATRIX_SIZE, MATRIX_SIZE))
+        matrices[:] = base_matrices
+        k1 = np.empty((m, n_steps))
+        k1[:] = base_k1
+        for value, index, step_size in zip(chunk_values.T, indices, step_sizes):
+            matrices[:, index] = _quadrupole_matrices(value, step_size)[:, np.newaxis]
+            k1[:, index] = value[:, np.newaxis]
+
+        twiss = np.empty((m, 8, n_steps + 1))
+        stable = np.empty(m, dtype=bool)
+        twiss_product_batch(matrices, twiss, stable, uncoupled=matrix_method.uncoupled)
+        twiss[~stable] = np.nan
+        beta_x, beta_y, alpha_x, alpha_y = twiss[:, :4].swapaxes(0, 1)
+        gamma_x, eta_x, eta_x_dds = twiss[:, 4], twiss[:, 6], twiss[:, 7]
+        result.stable[chunk] = stable
+        result.tune_x[chunk] = _tune(matrices, 0, beta_x, alpha_x)
+        result.tune_y[chunk] = _tune(matrices, 2, beta_y, alpha_y)
+        const = 0.25 / np.pi
+        result.chromaticity_x[chunk] = -const * trapz(k1 * beta_x[:, 1:], s[1:])
+        result.chromaticity_y[chunk] = +const * trapz(k1 * beta_y[:, 1:], s[1:])
+        if has_energy:
+            p_effect = poleface_effect(matrix_method, eta_x)
+            i4 = trapz(eta_x[:, 1:] * k0 * (k0**2 + 2 * k1), s[1:]) - p_effect
+            curly_h = (
+                gamma_x * eta_x**2
+                + 2 * alpha_x * eta_x * eta_x_dds
+                + beta_x * eta_x_dds**2
+            )
+            i5 = trapz(curly_h[:, 1:] * np.abs(k0**3), s[1:])
+            gamma = kwargs["energy"] * CONST_MEV_TO_GAMMA
+            result.emittance_x[chunk] = CONST_Q * gamma**2 * i5 / (i2 - i4)
+        if arrays:
+            result.beta_x[chunk] = beta_x
+            result.beta_y[chunk] = beta_y
+            result.eta_x[chunk] = eta_x
+
+    return result
+
+
+def _tune(matrices, i, beta, alpha) -> np.ndarray:
+    # exact phase advance of each step (see Twiss.psi)
+    m11, m12 = matrices[..., i, i], matrices[..., i, i + 1]
+    phase = np.arctan2(m12, beta[:, :-1] * m11 - alpha[:, :-1] * m12)
+    return np.sum(phase % TWO_PI, axis=-1) / TWO_PI
+
+
+def _quadrupole(lattice, key) -> Quadrupole:
+    element = lattice[key] if isinstance(key, str) else key
+    if not isinstance(element, Quadrupole):
+        raise TypeError(f"{element.name} is not a Quadrupole!")
+    return element
+
+
+def _quadrupole_matrices(k1, length) -> np.ndarray:
+    # quadrupoles with zero strength are drifts (see MatrixMethod)
+    matrices = quadrupole_matrices(k1, np.full(k1.size, length))
+    zero = k1 == 0
+    matrices[zero] = drift_matrices(np.full(np.count_nonzero(zero), length))
+    return matrices
+
+
+def _collect_fixed(obj, elements, varies, fixed, matrix_method) -> bool:
+    """Find the objects containing varied elements and cache the transfer matrices
+    of all others."""
+    if obj in varies:
+        return varies[obj]
+
+    if isinstance(obj, Lattice):
+        result = False
+        for child in obj.children:
+            result |= _collect_fixed(child, elements, varies, fixed, matrix_method)
+    else:
+        result = obj in elements
+    varies[obj] = result
+    if not result:
+        fixed[obj] = matrix_method.transfer_matrix(obj)
+    return result
+
+
+def _batched_transfer_matrix(obj, element_matrices, varies, fixed, cache):
+    """Transfer matrix of obj which is broadcasted over the grid."""
+    if obj in element_matrices:
+        return element_matrices[obj]
+    if not varies[obj]:
+        return fixed[obj]
+
+    matrix = cache.get(obj)
+    if matrix is None:
+        matrix = IDENTITY
+        for _, group in groupby(obj.children, key=id):
+            child = next(group)
+            count = 1 + sum(1 for _ in group)
+            args = element_matrices, varies, fixed, cache
+            child_matrix = _batched_transfer_matrix(child, *args)
+            if count > 1:
+                child_matrix = np.linalg.matrix_power(child_matrix, count)
+            matrix = np.matmul(child_matrix, matrix)
+        cache[obj] = matrix
+    return matrix
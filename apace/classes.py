@@ -1,6 +1,8 @@
 import inspect
 import latticejson
+import numpy as np
 import sys
+from contextlib import contextmanager
 from typing import List, Dict, Set, Union, Iterator
 from .utils import Signal, Attribute
 from .exceptions import AmbiguousNameError
@@ -266,11 +268,19 @@ class Lattice(Base):
         self._init_properties()
 
         self.element_changed: Signal = Signal()
-        """Gets emitted when an attribute of an element within this lattice changes."""
+        """Gets emitted when an attribute of an element within this lattice changes.
+        Is not emitted for changes within :meth:`batch_update`."""
         self.element_changed.connect(self._on_element_changed)
+        self.elements_changed: Signal = Signal()
+        """Gets emitted with a dict, which maps the changed elements within this
+        lattice to the set of their changed attributes. Is emitted once per change or
+        once at the end of :meth:`batch_update`."""
+        self._batch = None
+        self._table = None
 
         self.n_elements = len(self.sequence)
         """The number of elements within this lattice."""
+        self._periodicity = None
 
     @staticmethod
     def traverse_children(children) -> Iterator[Base]:
@@ -339,11 +349,87 @@ class Lattice(Base):
             lattice.length_changed()
 
     def _on_element_changed(self, element, attribute):
+        if self._batch is not None:
+            self._batch.setdefault(element, set()).add(attribute)
+            if attribute == Attribute.LENGTH:
+                for lattice in (self, *self._ancestors()):
+                    lattice._length_needs_update = True
+            return
+
         if attribute == Attribute.LENGTH:
             self.length_changed()
 
         for lattice in self.parent_lattices:
             lattice.element_changed(element, attribute)
+        self.elements_changed({element: {attribute}})
+
+    def _ancestors(self) -> Set["Lattice"]:
+        """All lattices which contain this lattice directly or indirectly."""
+        parents, ancestors = list(self.parent_lattices), set()
+        while parents:
+            lattice = parents.pop()
+            if lattice not in ancestors:
+                ancestors.add(lattice)
+                parents.extend(lattice.parent_lattices)
+        return ancestors
+
+    @contextmanager
+    def batch_update(self):
+        """Context manager which defers the notifications about changed elements of
+        this lattice. At the exit, this lattice, its sub-lattices and all lattices
+        containing them emit :attr:`elements_changed` once with their changes and
+        :attr:`length_changed` once if a length changed. The :attr:`length` of the
+        lattices is already up to date within the batch. Can be nested.
+
+        >>> with lattice.batch_update():
+        ...     for quadrupole in quadrupoles:
+        ...         quadrupole.k1 *= 1.01
+        """
+        lattices = [
+            lattice for lattice in (self, *self.sub_lattices) if lattice._batch is None
+        ]
+        if self not in lattices:  # already within a batch update
+            yield
+            return
+
+        changes = {}
+        for lattice in lattices:
+            lattice._batch = changes
+        try:
+            yield
+        finally:
+            for lattice in lattices:
+                lattice._batch = None
+            if changes:
+                self._emit_changes(changes, lattices)
+
+    def _emit_changes(self, changes, lattices):
+        """Emit the coalesced changes of a batch update for the lattices of the batch
+        and all other lattices containing them."""
+        ancestors = set()
+        for lattice in lattices:
+            ancestors.update(lattice._ancestors())
+        ancestors.difference_update(lattices)
+
+        for lattice in lattices:
+            own = _own_changes(lattice, changes).values()
+            if any(Attribute.LENGTH in attributes for attributes in own):
+                lattice.length_changed()
+        for lattice in (*lattices, *ancestors):
+            own = _own_changes(lattice, changes)
+            if own:
+                lattice.elements_changed(own)
+
+    def parameters(self, names) -> "Parameters":
+        """Returns a :class:`Parameters` vector of element attributes of this lattice.
+
+        >>> parameters = lattice.parameters(["Q1.k1", "Q2.k1", "B1.angle"])
+        >>> parameters.set(1.01 * parameters.get())
+
+        :param names: Names of the parameters in the form "<element>.<attribute>".
+        :type names: List[str]
+        """
+        return Parameters(self, names)
 
     @property
     def children(self) -> List[Base]:
@@ -355,6 +441,13 @@ class Lattice(Base):
         """List of elements in physical order. (Flattend :attr:`children`)"""
         return self._sequence
 
+    @property
+    def table(self) -> "SequenceTable":
+        """Columnar view of :attr:`sequence` (see :class:`SequenceTable`)."""
+        if self._table is None:
+            self._table = SequenceTable(self)
+        return self._table
+
     @property
     def indices(self) -> Dict[Element, List[float]]:
         """A dict which contains the a `List` of indices for each element.
@@ -362,6 +455,17 @@ class Lattice(Base):
         the list of indices of their first element."""
         return self._indices
 
+    @property
+    def periodicity(self) -> int:
+        """Number of identical consecutive periods the lattice consists of. The periods
+        are detected by comparing the identity of the children, which are then further
+        split by comparing the identity of the elements in the sequence."""
+        if self._periodicity is None:
+            n_children = _repetitions(self.children)
+            period = self.sequence[: len(self.sequence) // n_children]
+            self._periodicity = n_children * _repetitions(period)
+        return self._periodicity
+
     @property
     def objects(self) -> Dict[str, Union[Element, "Lattice"]]:
         """A Mapping from names to the given `Element` or `Lattice` object."""
@@ -446,3 +550,220 @@ class Lattice(Base):
             elements=elements_dict,
             lattices=lattices_dict,
         )
+
+
+class Parameters:
+    """A vector of element attributes of a lattice, which can be read and written at
+    once as flat array (e.g. by optimizers). Setting the vector changes the
+    attributes within :meth:`Lattice.batch_update`, so that the lattice and all
+    lattices containing it are notified once. Other lattices which share the elements
+    are notified per changed attribute.
+
+    :param Lattice lattice: The lattice which contains the elements.
+    :param names: Names of the parameters in the form "<element>.<attribute>".
+    :type names: List[str]
+    """
+
+    def __init__(self, lattice, names):
+        self.lattice: Lattice = lattice
+        """The lattice which contains the elements."""
+        self.names: List[str] = list(names)
+        """Names of the parameters."""
+        self._parameters = []
+        for name in self.names:
+            element_name, _, attribute_name = name.partition(".")
+            element = lattice.objects.get(element_name)
+            if not isinstance(element, Element):
+                raise ValueError(f"{lattice.name} has no element {element_name}!")
+
+            attribute = Attribute.__members__.get(attribute_name.upper())
+            if attribute is None or not hasattr(element, f"_{attribute_name}"):
+                raise ValueError(f"{element_name} has no attribute {attribute_name}!")
+
+            self._parameters.append((element, attribute_name))
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def __repr__(self):
+        return f"Parameters({self.names})"
+
+    def get(self) -> np.ndarray:
+        """Returns the current values of the parameters."""
+        return np.array([getattr(e, name) for e, name in self._parameters])
+
+    def set(self, values):
+        """Sets the parameters to `values`. Only the elements whose attributes change
+        are marked as changed.
+
+        :param values: The new values. Must have the same length as the parameters.
+        :type values: array-like
+        """
+        values = np.asarray(values, dtype=float)
+        if values.shape != (len(self),):
+            raise ValueError(
+                f"Expected {len(self)} values, but got array of shape {values.shape}!"
+            )
+
+        with self.lattice.batch_update():
+            for (element, name), value in zip(self._parameters, values.tolist()):
+                if getattr(element, name) != value:
+                    setattr(element, name, value)
+
+
+TYPE_CODES = {Drift: 0, Dipole: 1, Quadrupole: 2, Sextupole: 3, Octupole: 4}
+"""Type codes of the element classes in :attr:`SequenceTable.type`."""
+TABLE_ATTRIBUTES = ("length", "angle", "k1", "k2", "k3", "e1", "e2")
+"""Element attributes stored as columns of the :class:`SequenceTable`."""
+
+
+class SequenceTable:
+    """Structure-of-arrays view of the flattened lattice, which contains one array per
+    column with one entry per position in :attr:`Lattice.sequence`. Attributes which
+    an element does not have are zero. The table is kept in sync with the elements
+    through :attr:`Lattice.elements_changed`, where only the entries of the changed
+    elements get updated on the next access.
+
+    :param Lattice lattice: The lattice of the sequence.
+    """
+
+    def __init__(self, lattice):
+        self.elements: List[Element] = list(lattice.elements)
+        """Unordered list of the elements. Its order defines the element ids."""
+        self.element_ids: Dict[Element, int] = {
+            element: i for i, element in enumerate(self.elements)
+        }
+        """A mapping from the elements to their ids."""
+        self._indices = lattice.indices
+        self._changes = {}
+
+        n = len(lattice.sequence)
+        ids = self.element_ids
+        self._element = np.fromiter((ids[obj] for obj in lattice.sequence), np.intp, n)
+        types = [_type_code(element) for element in self.elements]
+        self._type = np.array(types, dtype=np.intp)[self._element]
+        rows = [
+            [getattr(element, f"_{name}", 0) for name in TABLE_ATTRIBUTES]
+            for element in self.elements
+        ]
+        columns = np.array(rows, dtype=float).reshape(-1, len(TABLE_ATTRIBUTES)).T
+        self._columns = {
+            name: column[self._element]
+            for name, column in zip(TABLE_ATTRIBUTES, columns)
+        }
+        self._s_start = None
+        lattice.elements_changed.connect(self._on_elements_changed)
+
+    def __len__(self):
+        return self._element.size
+
+    @property
+    def element(self) -> np.ndarray:
+        """Id of the element at each position (see :attr:`elements`)."""
+        return self._element
+
+    @property
+    def type(self) -> np.ndarray:
+        """Type code of the element at each position (see :data:`TYPE_CODES`)."""
+        return self._type
+
+    @property
+    def length(self) -> np.ndarray:
+        """Length of the element at each position (m)."""
+        return self._column("length")
+
+    @property
+    def angle(self) -> np.ndarray:
+        """Deflection angle of the element at each position (rad)."""
+        return self._column("angle")
+
+    @property
+    def k1(self) -> np.ndarray:
+        """Geometric quadrupole strength of the element at each position (m^-2)."""
+        return self._column("k1")
+
+    @property
+    def k2(self) -> np.ndarray:
+        """Geometric sextupole strength of the element at each position (m^-3)."""
+        return self._column("k2")
+
+    @property
+    def k3(self) -> np.ndarray:
+        """Geometric octupole strength of the element at each position (m^-4)."""
+        return self._column("k3")
+
+    @property
+    def e1(self) -> np.ndarray:
+        """Entrance angle of the element at each position (rad)."""
+        return self._column("e1")
+
+    @property
+    def e2(self) -> np.ndarray:
+        """Exit angle of the element at each position (rad)."""
+        return self._column("e2")
+
+    @property
+    def s_start(self) -> np.ndarray:
+        """Orbit position at the start of each position."""
+        if self._changes:
+            self._update()
+        if self._s_start is None:
+            length = self._columns["length"]
+            self._s_start = np.zeros(length.size)
+            np.cumsum(length[:-1], out=self._s_start[1:])
+        return self._s_start
+
+    def _column(self, name) -> np.ndarray:
+        if self._changes:
+            self._update()
+        return self._columns[name]
+
+    def _on_elements_changed(self, changes):
+        for element, attributes in changes.items():
+            self._changes.setdefault(element, set()).update(attributes)
+
+    def _update(self):
+        for element, attributes in self._changes.items():
+            indices = self._indices[element]
+            for attribute in attributes:
+                name = attribute.name.lower()
+                self._columns[name][indices] = getattr(element, f"_{name}")
+                if attribute == Attribute.LENGTH:
+                    self._s_start = None
+        self._changes.clear()
+
+
+def _type_code(element) -> int:
+    """Type code of the element, elements of unknown types are treated as drifts."""
+    for type_, code in TYPE_CODES.items():
+        if isinstance(element, type_):
+            return code
+    return TYPE_CODES[Drift]
+
+
+def _own_changes(lattice, changes):
+    """The changes of a batch update which concern elements of the lattice."""
+    elements = lattice.elements
+    return {e: attributes for e, attributes in changes.items() if e in elements}
+
+
+def _repetitions(objects) -> int:
+    """Returns how often the shortest period of objects is repeated. The objects are
+    compared by identity. (Uses the prefix function of the Knuth-Morris-Pratt
+    algorithm.)"""
+    n = len(objects)
+    if n == 0:
+        return 1
+
+    ids = [id(obj) for obj in objects]
+    prefix = [0] * n
+    for i in range(1, n):
+        k = prefix[i - 1]
+        while k > 0 and ids[i] != ids[k]:
+            k = prefix[k - 1]
+        if ids[i] == ids[k]:
+            k += 1
+        prefix[i] = k
+
+    period = n - prefix[-1]
+    return n // period if n % period == 0 else 1
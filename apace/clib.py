@@ -1,6 +1,9 @@
 import numpy as np
 from ._clib import ffi, lib
 
+PARALLEL_THRESHOLD = 10_000
+"""Minimum number of matrices for which the parallel accumulation is used."""
+
 
 def twiss_product(transfer_matrices, twiss_0, twiss_array, from_idx, parallel=False):
     """Calculates the Twiss product of the transfer matrices and the initial
@@ -26,7 +29,118 @@ def twiss_product(transfer_matrices, twiss_0, twiss_array, from_idx, parallel=Fa
     func(*args)
 
 
-def matrix_product_accumulated(input_array, output_array, from_idx):
+def betatron_phase(transfer_matrices, twiss_array, psi_array):
+    """Calculates the exact betatron phase from the transfer matrices of the steps
+    and the Twiss parameter at their entrance.
+
+    :param np.ndarray transfer_matrices: Transfer matrices of the steps. (n - 1, 6, 6)
+    :param np.ndarray twiss_array: Twiss parameter. (8, n)
+    :param np.ndarray psi_array: Array where the phase is stored. (2, n)
+    """
+    n = psi_array.shape[1]
+    args = (
+        n,
+        ffi.cast("double (*)[6][6]", ffi.from_buffer(transfer_matrices)),
+        ffi.cast("double (*)[]", ffi.from_buffer(twiss_array)),
+        ffi.cast("double (*)[]", ffi.from_buffer(psi_array)),
+    )
+    lib.betatron_phase(*args)
+
+
+def twiss_product_soa(transfer_matrices, twiss_0, twiss_array, from_idx):
+    """Same as :func:`twiss_product` but for accumulated transfer matrices in the
+    structure-of-arrays layout, where each matrix entry is a contiguous array. The
+    loop over the positions is vectorized.
+
+    :param np.ndarray transfer_matrices: Accumulated transfer matrices (6, 6, n - 1).
+    :param np.ndarray twiss_0: Initial twiss parameter.
+    :param np.ndarray twiss_array: Array where the result is stored. (8, n)
+    :param int from_idx: The index from which the matrices are accumulated.
+    """
+    n = twiss_array.shape[1]
+    args = (
+        n,
+        from_idx,
+        ffi.cast("double *", ffi.from_buffer(transfer_matrices)),
+        ffi.cast("double *", ffi.from_buffer(twiss_0)),
+        ffi.cast("double (*)[]", ffi.from_buffer(twiss_array)),
+    )
+    lib.twiss_product_soa(*args)
+
+
+def twiss_product_streaming(matrices, twiss_0, twiss_array, from_idx, uncoupled=False):
+    """Same as :func:`twiss_product` but takes the (not accumulated) transfer matrices
+    and accumulates them on the fly, so that the accumulated matrices are never stored.
+
+    :param np.ndarray matrices: Array of transfer matrices. (n - 1, 6, 6)
+    :param np.ndarray twiss_0: Initial twiss parameter.
+    :param np.ndarray twiss_array: Array where the result is stored. (8, n)
+    :param int from_idx: The index from which the matrices are accumulated.
+    :param bool uncoupled: Flag to use the kernel for uncoupled matrices.
+    """
+    n = twiss_array.shape[1]
+    args = (
+        n,
+        from_idx,
+        ffi.cast("double (*)[6][6]", ffi.from_buffer(matrices)),
+        ffi.cast("double *", ffi.from_buffer(twiss_0)),
+        ffi.cast("double (*)[]", ffi.from_buffer(twiss_array)),
+    )
+    if uncoupled:
+        lib.twiss_product_streaming_uncoupled(*args)
+    else:
+        lib.twiss_product_streaming(*args)
+
+
+def twiss_product_multiple(transfer_matrices, twiss_0, twiss_array, from_idx):
+    """Same as :func:`twiss_product` but for multiple initial Twiss parameter, which
+    share the accumulated transfer matrices.
+
+    :param np.ndarray transfer_matrices: Accumulated transfer matrices. (n - 1, 6, 6)
+    :param np.ndarray twiss_0: Initial twiss parameter. (m, 8)
+    :param np.ndarray twiss_array: Array where the result is stored. (m, 8, n)
+    :param int from_idx: The index from which the matrices are accumulated.
+    """
+    m, _, n = twiss_array.shape
+    args = (
+        n,
+        m,
+        from_idx,
+        ffi.cast("double (*)[6][6]", ffi.from_buffer(transfer_matrices)),
+        ffi.cast("double (*)[8]", ffi.from_buffer(twiss_0)),
+        ffi.cast("double *", ffi.from_buffer(twiss_array)),
+    )
+    lib.twiss_product_multiple(*args)
+
+
+def twiss_product_batch(matrices, twiss_array, stable, uncoupled=False):
+    """Calculate the periodic Twiss parameter of many variants of a lattice. The
+    variants are distributed over multiple threads. The Twiss parameter of variants
+    without a periodic solution are left unchanged.
+
+    :param np.ndarray matrices: Transfer matrices of the variants. (m, n - 1, 6, 6)
+    :param np.ndarray twiss_array: Array where the result is stored. (m, 8, n)
+    :param np.ndarray stable: Boolean array where it is stored whether the variants
+                              have a periodic solution. (m)
+    :param bool uncoupled: Flag to use the kernel for uncoupled matrices.
+    """
+    n_variants, _, n = twiss_array.shape
+    args = (
+        n_variants,
+        n,
+        ffi.cast("double (*)[6][6]", ffi.from_buffer(matrices)),
+        ffi.cast("double *", ffi.from_buffer(twiss_array)),
+        ffi.cast("int8_t *", ffi.from_buffer(stable.view(np.int8))),
+    )
+    if uncoupled:
+        lib.twiss_product_batch_uncoupled(*args)
+    else:
+        lib.twiss_product_batch(*args)
+
+
+def matrix_product_accumulated(
+    input_array, output_array, from_idx, parallel=False, uncoupled=False
+):
     """Perform accumulated matrix product on array of matrices.
 
     The input matrices A[0], A[2], ... of the input array (A)
@@ -42,6 +156,12 @@ def matrix_product_accumulated(input_array, output_array, from_idx):
     :param output_array: The array into which the result is stored. (n, size, size)
     :type output_array: nd.ndarray
     :param int from_idx: The index from which the matrices are accumulated.
+    :param bool parallel: Flag to use a parallel scan on multiple cpu cores. Arrays
+                          with less than `PARALLEL_THRESHOLD` matrices are always
+                          accumulated serially. (Default=False)
+    :param bool uncoupled: Flag to use kernels which only multiply the non-zero blocks
+                           of uncoupled linear transfer matrices. Must only be set if
+                           all matrices are uncoupled. (Default=False)
     """
     n = input_array.shape[0]
     if from_idx >= n:
@@ -57,10 +177,52 @@ def matrix_product_accumulated(input_array, output_array, from_idx):
         ffi.cast("double (*)[6][6]", ffi.from_buffer(output_array)),
     )
 
-    lib.matrix_product_accumulated(*args)
+    name = "matrix_product_accumulated"
+    if parallel and n >= PARALLEL_THRESHOLD:
+        name += "_parallel"
+    if uncoupled:
+        name += "_uncoupled"
+    getattr(lib, name)(*args)
+
+
+def matrix_product_accumulated_soa(
+    input_array, output_array, from_idx, uncoupled=False
+):
+    """Same as :func:`matrix_product_accumulated` but for arrays in the
+    structure-of-arrays layout, where each matrix entry is a contiguous array.
+
+    Only the first n matrices of the input array are accumulated, where n is given by
+    the size of the output array.
+
+    :param input_array: Input array with N >= n matrices. (size, size, N)
+    :type input_array: nd.ndarray
+    :param output_array: The array into which the result is stored. (size, size, n)
+    :type output_array: nd.ndarray
+    :param int from_idx: The index from which the matrices are accumulated.
+    :param bool uncoupled: Flag to use the kernel for uncoupled matrices.
+    """
+    n = output_array.shape[2]
+    if from_idx >= n:
+        raise IndexError(
+            f"The parameter from_idx ({from_idx}) "
+            f"cannot be larger than the number of kicks ({n})!"
+        )
+
+    args = (
+        n,
+        input_array.shape[2],
+        from_idx,
+        ffi.cast("double *", ffi.from_buffer(input_array)),
+        ffi.cast("double *", ffi.from_buffer(output_array)),
+    )
+
+    if uncoupled:
+        lib.matrix_product_accumulated_soa_uncoupled(*args)
+    else:
+        lib.matrix_product_accumulated_soa(*args)
 
 
-def matrix_product_ranges(input_array, output_array, ranges):
+def matrix_product_ranges(input_array, output_array, ranges, uncoupled=False):
     """Perform matrix product on array of matrices for given ranges.
 
     The final array has the shape (n, size, size) and contains the accumulated transfer
@@ -79,13 +241,17 @@ def matrix_product_ranges(input_array, output_array, ranges):
     :param ranges: The start and end indicies for the matrix accumulation, where
                     ranges[:, 0] are the start and ranges[:, 1] are the end values.
     :type ranges: array-like
+    :param bool uncoupled: Flag to use a kernel which only multiplies the non-zero
+                           blocks of uncoupled linear transfer matrices. (Default=False)
     """
     n_kicks = input_array.shape[0]
     n_ranges = ranges.shape[0]
     if ranges.ndim != 2 or ranges.shape[1] != 2:
         raise ValueError("The argument indices has the wrong shape! (Expected (n, 2))")
 
-    if np.any((0 > ranges) | (ranges[:, 0] >= n_kicks) | ranges[:, 1] > n_kicks):
+    if np.any(ranges < 0) or np.any(
+        (ranges[:, 0] >= n_kicks) | (ranges[:, 1] > n_kicks)
+    ):
         raise ValueError(f"Ranges must be within [0, {n_kicks}].")
 
     if not isinstance(ranges, np.ndarray) or ranges.dtype != np.int32:
@@ -99,7 +265,10 @@ def matrix_product_ranges(input_array, output_array, ranges):
         ffi.cast("double (*)[6][6]", ffi.from_buffer(output_array)),
     )
 
-    lib.matrix_product_ranges(*args)
+    if uncoupled:
+        lib.matrix_product_ranges_uncoupled(*args)
+    else:
+        lib.matrix_product_ranges(*args)
 
 
 def multiple_dot_products(A, B, out):
@@ -1,12 +1,21 @@
+from collections import OrderedDict
+from itertools import groupby
 from typing import List, Dict
 import numpy as np
 from math import ceil
-from .classes import Element, Drift, Dipole, Quadrupole
-from .utils import Signal, Attribute
+from .classes import Element, Drift, Dipole, Quadrupole, Lattice
+from .utils import Signal, Attribute, cached_property, connect_dependencies
+from .utils import deprecated_update
 from .clib import matrix_product_accumulated
 
 MATRIX_SIZE = 6
 IDENTITY = np.identity(MATRIX_SIZE)
+_DIAGONAL = np.arange(MATRIX_SIZE)
+_BODY, _ENTRANCE, _EXIT = range(3)  # kinds of step matrices per element
+# non-zero entries of uncoupled linear transfer matrices
+UNCOUPLED_MASK = np.zeros((MATRIX_SIZE, MATRIX_SIZE), dtype=bool)
+UNCOUPLED_MASK[0:2, 0:2] = UNCOUPLED_MASK[2:4, 2:4] = True
+UNCOUPLED_MASK[0:2, 5] = UNCOUPLED_MASK[4, [0, 1, 4, 5]] = UNCOUPLED_MASK[5, 5] = True
 C = 299_792_458
 C_SQUARED = C ** 2
 CONST_MEV = 1.602176634e-13  # MeV to Joule
@@ -18,20 +27,218 @@ CONST_ME = 9.1093837015e-31  # kg
 #    3. User defined function, which returns number of steps for given element
 
 
+class MatrixCache:
+    """A size-bounded LRU cache of element step matrices, which is shared by all
+    :class:`MatrixMethod` objects. The entries are keyed by the content of an element
+    (type, length, strength, edge angles and number of steps), so that elements with
+    the same parameters never have to be recomputed.
+
+    :param int maxsize: Maximum number of entries.
+    """
+
+    def __init__(self, maxsize=10_000):
+        self._entries = OrderedDict()
+        self._maxsize = maxsize
+        self.hits = 0
+        """Number of lookups which were found in the cache."""
+        self.misses = 0
+        """Number of lookups which were not found in the cache."""
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return (
+            f"MatrixCache(hits={self.hits}, misses={self.misses}, "
+            f"size={len(self)}, maxsize={self.maxsize})"
+        )
+
+    __repr__ = __str__
+
+    @property
+    def maxsize(self) -> int:
+        """Maximum number of entries. Least recently used entries are discarded."""
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self._maxsize = value
+        self._shrink()
+
+    def get(self, key):
+        """Return the cached step matrices for `key` or None if there are none."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value):
+        """Add the step matrices `value` for `key` to the cache."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._shrink()
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def _shrink(self):
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+class ProductTree:
+    """Balanced binary tree of matrix products. The leaves hold matrices in physical
+    order and each node holds the product of its two children, so that the root is
+    the product of all leaves. Changing leaves only updates the nodes above them,
+    which are O(log n) per leaf.
+
+    :param leaves: Sequence of n matrices. (n, 6, 6)
+    :type leaves: array-like
+    """
+
+    def __init__(self, leaves):
+        self.n_leaves = len(leaves)
+        self._size = 1 << max(self.n_leaves - 1, 0).bit_length()
+        self._nodes = np.empty((2 * self._size, MATRIX_SIZE, MATRIX_SIZE))
+        self._nodes[self._size :] = IDENTITY
+        self._nodes[self._size : self._size + self.n_leaves] = leaves
+        for i in range(self._size - 1, 0, -1):
+            self._update_node(i)
+
+    @property
+    def root(self) -> np.ndarray:
+        """Product of all leaves, where later leaves are multiplied from the left."""
+        return self._nodes[1]
+
+    def update(self, indices, matrices):
+        """Replace the leaves at `indices` by `matrices` and update their ancestors.
+
+        :param List[int] indices: Indices of the leaves.
+        :param matrices: Sequence of the new matrices.
+        :type matrices: array-like
+        """
+        nodes = set()
+        for i, matrix in zip(indices, matrices):
+            self._nodes[self._size + i] = matrix
+            nodes.add((self._size + i) // 2)
+
+        # all leaves have the same depth, so the nodes can be updated level by level
+        while nodes:
+            for i in nodes:
+                self._update_node(i)
+            nodes = {i // 2 for i in nodes if i > 1}
+
+    def _update_node(self, i):
+        np.dot(self._nodes[2 * i + 1], self._nodes[2 * i], out=self._nodes[i])
+
+
+def drift_matrices(step_size) -> np.ndarray:
+    """Transfer matrices of drift spaces (and all other elements without a linear
+    effect) for an array of step sizes. Returns an array of shape (n, 6, 6)."""
+    matrices = np.zeros((step_size.size, MATRIX_SIZE, MATRIX_SIZE))
+    matrices[:, _DIAGONAL, _DIAGONAL] = 1
+    matrices[:, 0, 1] = matrices[:, 2, 3] = step_size
+    return matrices
+
+
+def quadrupole_matrices(k1, step_size) -> np.ndarray:
+    """Transfer matrices of horizontal focusing (k1 > 0) and defocusing (k1 < 0)
+    quadrupoles for arrays of strengths and step sizes. Returns an array of
+    shape (n, 6, 6)."""
+    sqk = np.sqrt(np.absolute(k1))
+    om = sqk * step_size
+    sin = np.sin(om)
+    cos = np.cos(om)
+    sinh = np.sinh(om)
+    cosh = np.cosh(om)
+
+    matrices = np.zeros((k1.size, MATRIX_SIZE, MATRIX_SIZE))
+    matrices[:, 4, 4] = matrices[:, 5, 5] = 1
+    for focusing, (x, y) in ((k1 > 0, (0, 2)), (k1 < 0, (2, 0))):
+        sqk_, sin_, cos_ = sqk[focusing], sin[focusing], cos[focusing]
+        sinh_, cosh_ = sinh[focusing], cosh[focusing]
+        m = matrices[focusing]
+        m[:, x, x] = m[:, x + 1, x + 1] = cos_
+        m[:, x, x + 1] = 1 / sqk_ * sin_
+        m[:, x + 1, x] = -sqk_ * sin_
+        m[:, y, y] = m[:, y + 1, y + 1] = cosh_
+        m[:, y, y + 1] = 1 / sqk_ * sinh_
+        m[:, y + 1, y] = sqk_ * sinh_
+        matrices[focusing] = m
+
+    return matrices
+
+
+def dipole_matrices(angle, length, steps) -> np.ndarray:
+    """Transfer matrices of a single step through sector dipoles (without edge
+    focusing) for arrays of angles, lengths and number of steps. Returns an array of
+    shape (n, 6, 6)."""
+    phi = angle / steps
+    sin = np.sin(phi)
+    cos = np.cos(phi)
+    radius = length / angle
+    k0 = angle / length
+    matrices = np.zeros((angle.size, MATRIX_SIZE, MATRIX_SIZE))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = cos
+    matrices[:, 0, 1] = radius * sin
+    matrices[:, 0, 5] = radius * (1 - cos)
+    matrices[:, 1, 0] = -k0 * sin
+    matrices[:, 1, 5] = sin
+    matrices[:, 2, 2] = matrices[:, 3, 3] = 1
+    matrices[:, 2, 3] = length / steps
+    matrices[:, 4, 0] = -sin
+    matrices[:, 4, 1] = (cos - 1) * radius
+    matrices[:, 4, 4] = matrices[:, 5, 5] = 1
+    matrices[:, 4, 5] = (sin - phi) * radius
+    return matrices
+
+
+def _edge_matrices(edge_angle, radius) -> np.ndarray:
+    tan_r = np.tan(edge_angle) / radius
+    matrices = np.zeros((tan_r.size, MATRIX_SIZE, MATRIX_SIZE))
+    matrices[:, _DIAGONAL, _DIAGONAL] = 1
+    matrices[:, 1, 0], matrices[:, 3, 2] = tan_r, -tan_r
+    return matrices
+
+
+def entrance_edge(matrices, e1, radius) -> np.ndarray:
+    """Multiply the entrance edge focusing onto an array of dipole matrices."""
+    return np.matmul(matrices, _edge_matrices(e1, radius))
+
+
+def exit_edge(matrices, e2, radius) -> np.ndarray:
+    """Multiply the exit edge focusing onto an array of dipole matrices."""
+    return np.matmul(_edge_matrices(e2, radius), matrices)
+
+
 class MatrixMethod:
     """The transfer matrix method.
 
     :param lattice: Lattice which transfer matrices gets calculated for.
     :param int steps_per_element: Fixed number of steps per element.
-                                     (ignored if steps_per_meter is passed)
+                                     (ignored if steps_per_meter is passed) One step
+                                     per element gives the element-boundary mode,
+                                     where values within the elements are obtained
+                                     by :meth:`Twiss.at`.
     :param number steps_per_meter: Fixed number of steps per meter.
     :param int start_index: Start index for the one-turn matrix and for the accumulated
                             transfer matrices.
     :param number start_position: Same as start_index but uses position instead of index
                                   of the position. Is ignored if start_index is set.
     :param number energy: Total energy per particle in MeV.
+    :param str layout: Memory layout of the transfer matrices. Either "aos" (array of
+                       structures, shape (n_kicks, 6, 6)) or "soa" (structure of
+                       arrays, shape (6, 6, n_kicks)). (Default="aos")
     """
 
+    cache = MatrixCache()
+    """Process-wide cache of element step matrices shared by all instances."""
+
     def __init__(
         self,
         lattice,
@@ -40,9 +247,14 @@ class MatrixMethod:
         start_index=None,
         start_position=None,
         energy=None,
+        layout="aos",
     ):
         self.lattice = lattice
         self._energy = energy
+        if layout not in ("aos", "soa"):
+            raise ValueError('layout must be either "aos" or "soa".')
+        self.layout = layout
+        """Memory layout of the transfer matrices."""
         if steps_per_meter is None:
             if isinstance(steps_per_element, (int, float)):
                 self.get_steps = lambda element: steps_per_element
@@ -60,49 +272,41 @@ class MatrixMethod:
             raise TypeError("steps_per_meter must be a number or a dict.")
 
         self.changed_elements = self.lattice.elements.copy()
-        self.lattice.element_changed.connect(self._on_element_changed)
-
-        self._element_indices = {}
-        self._element_indices_needs_update = True
-        self.element_indices_changed = Signal()
-        self.element_indices_changed.connect(self._on_element_indices_changed)
-
-        self._n_steps = 0
-        self._n_steps_needs_update = True
-        self.n_steps_changed = Signal()
-        self.n_steps_changed.connect(self._on_n_steps_changed)
+        self.lattice.elements_changed.connect(self._on_elements_changed)
 
         self._step_size = np.empty(0)
-        self._step_size_needs_update = True
-        self.step_size_changed = Signal(
-            self.n_steps_changed, self.lattice.length_changed
-        )
-        self.step_size_changed.connect(self._on_step_size_changed)
-
         self._s = np.empty(0)
-        self._s_needs_update = True
-        self.s_changed = Signal(self.step_size_changed)
-        self.s_changed.connect(self._on_s_changed)
-
         self._matrices = np.empty(0)
-        self.matrices_changed = Signal()
         self._k0 = np.empty(0)
         self._k1 = np.empty(0)
 
+        # compact tables with one body, entrance and exit step matrix per element
+        self._table_elements = self.lattice.table.elements
+        self._table_index = self.lattice.table.element_ids
+        n_elements = len(self._table_index)
+        self._table = np.empty((n_elements, 3, MATRIX_SIZE, MATRIX_SIZE))
+        self._table_k0 = np.empty(n_elements)
+        self._table_k1 = np.empty(n_elements)
+        self._table_e1 = np.empty(n_elements)
+        self._slice_elements = np.empty(0, dtype=np.intp)
+        self._slice_rows = np.empty(0, dtype=np.intp)
+        self._slice_first = np.empty(0, dtype=bool)
+        self._uncoupled = None
+
         self._start_index = start_index
-        self._start_position_changed = Signal()
+        self.start_index_changed = Signal()
+        """Gets emitted when the start index changes."""
+        self._matrices_acc = np.empty(0)
+        connect_dependencies(self, MatrixMethod)
 
         if start_position is not None and start_index is None:
             self.start_position = start_position
 
-        self._matrices_acc = np.empty(0)
-        self._matrices_acc_needs_update = True
-        self.matrices_acc_changed = Signal(
-            self.matrices_changed, self._start_position_changed
-        )
-        self.matrices_acc_changed.connect(self._on_matrices_accumulated_changed)
-
         self._one_turn_matrix = np.empty(0)
+        self._transfer_matrices = {}
+        self._product_trees = {}
+        self._run_indices = {}
+        self._changed_children = {}
 
     @property
     def energy(self) -> float:
@@ -118,202 +322,344 @@ class MatrixMethod:
     def velocity(self) -> float:
         return C * np.sqrt(1 - 1 / self.gamma ** 2)
 
-    def _on_element_changed(self, element, attribute):
-        if attribute == Attribute.LENGTH:
-            # TODO: n_steps and n_indices can change if the length of an element changes
-            # but it is relativly expensive to recalculate them every time!
-            # n_steps_changed()
-            # element_indices_changed()
-            pass
-
-        self.changed_elements.add(element)
+    def _on_elements_changed(self, changes):
+        # TODO: n_steps and n_indices can change if the length of an element changes
+        # but it is relativly expensive to recalculate them every time!
+        self.changed_elements.update(changes)
+        for element in changes:
+            self._discard_transfer_matrices(element)
         self.matrices_changed()
 
-    @property
+    def _discard_transfer_matrices(self, obj):
+        """Discard the cached transfer matrices of obj and all lattices containing it.
+        Lattices which are not part of :attr:`lattice` are skipped."""
+        self._transfer_matrices.pop(obj, None)
+        for lattice in obj.parent_lattices:
+            if lattice is self.lattice or lattice in self.lattice.sub_lattices:
+                self._changed_children.setdefault(lattice, set()).add(obj)
+                self._discard_transfer_matrices(lattice)
+
+    @cached_property()
+    def sequence_steps(self) -> np.ndarray:
+        """Number of steps of each element of the lattice sequence."""
+        table = self.lattice.table
+        n_elements = len(table.elements)
+        steps = np.fromiter(map(self.get_steps, table.elements), np.intp, n_elements)
+        return steps[table.element]
+
+    @cached_property("sequence_steps")
+    def sequence_starts(self) -> np.ndarray:
+        """Index of the first step of each element of the lattice sequence."""
+        steps = self.sequence_steps
+        return np.cumsum(steps) - steps
+
+    @cached_property("sequence_steps")
     def n_steps(self) -> int:
         """Total number of steps."""
-        if self._n_steps_needs_update:
-            self.update_n_steps()
-        return self._n_steps
-
-    def update_n_steps(self):
-        """Manually update the total number of kicks."""
-        self._n_steps = sum(map(self.get_steps, self.lattice.sequence))
-        self._n_steps_needs_update = False
+        return int(self.sequence_steps.sum())
 
-    def _on_n_steps_changed(self):
-        self._n_steps_needs_update = True
+    update_n_steps = deprecated_update("n_steps")
 
-    @property
+    @cached_property("sequence_steps")
     def element_indices(self) -> Dict[Element, List[int]]:
         """Contains the indices of each element within the transfer_matrices."""
-        if self._element_indices_needs_update:
-            self.update_element_indices()
-        return self._element_indices
-
-    def update_element_indices(self):
-        """Manually update the indices of each element."""
-        self._element_indices.clear()
-        start = 0
-        for element in self.lattice.sequence:
-            end = start + self.get_steps(element)
-            tmp = list(range(start, end))
-            try:
-                self._element_indices[element].extend(tmp)
-            except KeyError:
-                self._element_indices[element] = tmp
-            start = end
-
-        self._element_indices_needs_update = False
-
-    def _on_element_indices_changed(self):
-        self._element_indices_needs_update = True
-
-    @property
+        table = self.lattice.table
+        steps = self.sequence_steps
+        self._slice_elements = np.repeat(table.element, steps)
+        order = np.argsort(self._slice_elements, kind="stable")
+        counts = np.bincount(self._slice_elements, minlength=len(table.elements))
+        groups = np.split(order, np.cumsum(counts)[:-1])
+        element_indices = {
+            element: group.tolist() for element, group in zip(table.elements, groups)
+        }
+
+        # map every slice onto its row in the compact table of step matrices
+        n_steps = self._slice_elements.size
+        starts = self.sequence_starts[steps > 0]
+        kinds = np.full(n_steps, _BODY)
+        kinds[starts] = _ENTRANCE
+        kinds[starts + steps[steps > 0] - 1] = _EXIT
+        self._slice_rows = 3 * self._slice_elements + kinds
+        self._slice_first = np.zeros(n_steps, dtype=bool)
+        self._slice_first[starts] = True
+        return element_indices
+
+    update_element_indices = deprecated_update("element_indices")
+
+    @cached_property("n_steps", "element_indices", "lattice.length")
     def step_size(self) -> np.ndarray:
         """Contains the step_size for each point. Has length of `n_kicks`"""
-        if self._step_size_needs_update:
-            self.update_step_size()
-
-        return self._step_size
-
-    def update_step_size(self):
-        """Manually update the step_size array."""
         if self._step_size.size != self.n_steps:
             self._step_size = np.empty(self.n_steps)
             self._step_size[0] = 0
 
-        for element in self.lattice.elements:
-            n_steps = self.get_steps(element)
-            self._step_size[self.element_indices[element]] = element.length / n_steps
-
-        self._step_size_needs_update = False
+        steps = self.sequence_steps
+        length = self.lattice.table.length
+        step_size = np.divide(length, steps, out=np.zeros(steps.size), where=steps > 0)
+        self._step_size[:] = np.repeat(step_size, steps)
+        return self._step_size
 
-    def _on_step_size_changed(self):
-        self._step_size_needs_update = True
+    update_step_size = deprecated_update("step_size")
 
-    @property
+    @cached_property("step_size")
     def s(self) -> np.ndarray:
         """Contains the orbit position s for each point. Has length of `n_kicks + 1`."""
-        if self._s_needs_update:
-            self.update_s()
-
-        return self._s
-
-    def update_s(self):
-        """Manually update the orbit position array s."""
         points = self.n_steps + 1
         if self._s.size != points:
             self._s = np.empty(points)
             self._s[0] = 0
 
         np.add.accumulate(self.step_size, out=self._s[1:])
+        return self._s
 
-    def _on_s_changed(self):
-        self._s_needs_update = True
-
-    @property
-    def matrices(self) -> np.ndarray:
-        """Array of transfer matrices with shape (6, 6, n_kicks)"""
-        if self.changed_elements:
-            self.update_matrices()
-        return self._matrices
+    update_s = deprecated_update("s")
 
     @property
     def k0(self) -> np.ndarray:
         """Array of deflections angles with shape (n_kicks)."""
-        if self.changed_elements:
-            self.update_matrices()
+        self.matrices
         return self._k0
 
     @property
     def k1(self) -> np.ndarray:
         """Array of geometric quadruole strenghts with shape (n_kicks)."""
-        if self.changed_elements:
-            self.update_matrices()
+        self.matrices
         return self._k1
 
-    def update_matrices(self):
-        """Manually update the transfer_matrices."""
-        if self._matrices.shape[0] != self.n_steps:
-            self._matrices = np.empty((self.n_steps, MATRIX_SIZE, MATRIX_SIZE))
+    @cached_property("n_steps", "element_indices")
+    def matrices(self) -> np.ndarray:
+        """Array of transfer matrices with shape (n_kicks, 6, 6). For the "soa" layout
+        this is a transposed view of the underlying (6, 6, n_kicks) array. Gets
+        updated when an element of the lattice changes."""
+        if self.changed_elements:
+            self.update_step_matrices()
+
+        if self._k0.shape[0] != self.n_steps:
+            shape = self.n_steps, MATRIX_SIZE, MATRIX_SIZE
+            if self.layout == "soa":
+                shape = shape[1:] + shape[:1]
+            self._matrices = np.empty(shape)
             self._k0 = np.empty(self.n_steps)
             self._k1 = np.empty(self.n_steps)
 
-        elements = self.changed_elements
-
-        matrix_array = self._matrices
-        for element in elements:
-            pos = self.element_indices[element]  # indices in matrix array
-            n_kicks = self.get_steps(element)
-            step_size = element.length / n_kicks
-
-            # TODO: change element (4,5) for velocity smaller than light
-            # el_45 = 0 if energy is None else step_size / gamma ** 2
-
-            self._k0[pos] = k0 = getattr(element, "k0", 0)
-            self._k1[pos] = k1 = getattr(element, "k1", 0)
-
-            if isinstance(element, Quadrupole) and k1:
-                sqk = np.sqrt(np.absolute(k1))
-                om = sqk * step_size
-                sin = np.sin(om)
-                cos = np.cos(om)
-                sinh = np.sinh(om)
-                cosh = np.cosh(om)
-                if k1 > 0:  # horizontal focusing
-                    matrix_array[pos] = [
-                        [cos, 1 / sqk * sin, 0, 0, 0, 0],
-                        [-sqk * sin, cos, 0, 0, 0, 0],
-                        [0, 0, cosh, 1 / sqk * sinh, 0, 0],
-                        [0, 0, sqk * sinh, cosh, 0, 0],
-                        [0, 0, 0, 0, 1, 0],
-                        [0, 0, 0, 0, 0, 1],
-                    ]
-                else:  # vertical focusing
-                    matrix_array[pos] = [
-                        [cosh, 1 / sqk * sinh, 0, 0, 0, 0],
-                        [sqk * sinh, cosh, 0, 0, 0, 0],
-                        [0, 0, cos, 1 / sqk * sin, 0, 0],
-                        [0, 0, -sqk * sin, cos, 0, 0],
-                        [0, 0, 0, 0, 1, 0],
-                        [0, 0, 0, 0, 0, 1],
-                    ]
-            elif isinstance(element, Dipole) and k0:
-                phi = element.angle / n_kicks
-                sin = np.sin(phi)
-                cos = np.cos(phi)
-                radius = element.radius
-                matrix_array[pos] = [
-                    [cos, radius * sin, 0, 0, 0, radius * (1 - cos)],
-                    [-k0 * sin, cos, 0, 0, 0, sin],
-                    [0, 0, 1, step_size, 0, 0],
-                    [0, 0, 0, 1, 0, 0],
-                    [-sin, (cos - 1) * radius, 0, 0, 1, (sin - phi) * radius],
-                    [0, 0, 0, 0, 0, 1],
-                ]
-
-                if element.e1:
-                    tan_r1 = np.tan(element.e1) / radius
-                    matrix_edge_1 = IDENTITY.copy()
-                    matrix_edge_1[1, 0], matrix_edge_1[3, 2] = tan_r1, -tan_r1
-                    matrix_array[pos[::n_kicks]] = np.dot(
-                        matrix_array[pos[0]], matrix_edge_1
-                    )
-
-                if element.e2:
-                    tan_r2 = np.tan(element.e2) / radius
-                    matrix_edge_2 = IDENTITY.copy()
-                    matrix_edge_2[1, 0], matrix_edge_2[3, 2] = tan_r2, -tan_r2
-                    matrix_array[pos[n_kicks - 1 :: n_kicks]] = np.dot(
-                        matrix_edge_2, matrix_array[pos[-1]]
-                    )
+        self.element_indices
+
+        # gather the step matrices of all slices from the compact table
+        table = self._table.reshape(-1, MATRIX_SIZE, MATRIX_SIZE)
+        if self.layout == "soa":
+            table = table.transpose(1, 2, 0)
+            np.take(table, self._slice_rows, axis=2, out=self._matrices)
+        else:
+            np.take(table, self._slice_rows, axis=0, out=self._matrices)
+        np.take(self._table_k0, self._slice_elements, out=self._k0)
+        np.take(self._table_k1, self._slice_elements, out=self._k1)
+        if self.layout == "soa":
+            return self._matrices.transpose(2, 0, 1)
+        return self._matrices
+
+    update_matrices = deprecated_update("matrices")
+
+    def update_step_matrices(self):
+        """Manually update the compact table of step matrices of changed elements."""
+        # TODO: change element (4,5) for velocity smaller than light
+        # el_45 = 0 if energy is None else step_size / gamma ** 2
+
+        # look up the step matrices of all changed elements in the shared cache and
+        # group the missing elements by type to compute them vectorized
+        table = self._table
+        table_index = self._table_index
+        cache = self.cache
+        hits, cached = [], []
+        drifts, quadrupoles, dipoles = [], [], []
+        for element in self.changed_elements:
+            i = table_index[element]
+            steps = self.get_steps(element)
+            if isinstance(element, Quadrupole) and element.k1:
+                key = Quadrupole, element.length, element.k1, steps
+                self._table_k0[i], self._table_k1[i] = 0, element.k1
+                self._table_e1[i] = 0
+                group = quadrupoles
+            elif isinstance(element, Dipole) and element.k0:
+                e1, e2 = element.e1, element.e2
+                key = Dipole, element.length, element.angle, e1, e2, steps
+                self._table_k0[i], self._table_k1[i] = element.k0, 0
+                self._table_e1[i] = e1
+                group = dipoles
             else:  # Drifts and remaining elements
-                matrix = IDENTITY.copy()
-                matrix[0, 1] = matrix[2, 3] = step_size
-                matrix_array[pos] = matrix
+                key = Drift, element.length, steps
+                self._table_k0[i] = self._table_k1[i] = self._table_e1[i] = 0
+                group = drifts
+
+            rows = cache.get(key)
+            if rows is None:
+                group.append((i, key, steps, element))
+            else:
+                hits.append(i)
+                cached.append(rows)
+
+        if hits:
+            table[hits] = cached
+
+        if drifts:
+            ids, keys, steps, elements = zip(*drifts)
+            steps = np.array(steps)
+            length = np.array([element.length for element in elements])
+            table[list(ids)] = drift_matrices(length / steps)[:, np.newaxis]
+            self._cache_rows(ids, keys)
+
+        if quadrupoles:
+            ids, keys, steps, elements = zip(*quadrupoles)
+            steps = np.array(steps)
+            length = np.array([element.length for element in elements])
+            k1 = np.array([element.k1 for element in elements])
+            table[list(ids)] = quadrupole_matrices(k1, length / steps)[:, np.newaxis]
+            self._cache_rows(ids, keys)
+
+        if dipoles:
+            ids, keys, steps, elements = zip(*dipoles)
+            ids = list(ids)
+            steps = np.array(steps)
+            length = np.array([element.length for element in elements])
+            angle = np.array([element.angle for element in elements])
+            e1 = np.array([element.e1 for element in elements])
+            e2 = np.array([element.e2 for element in elements])
+            radius = length / angle
+            matrices = dipole_matrices(angle, length, steps)
+
+            # edge focusing only changes the first and the last step of each dipole
+            entrance = matrices.copy()
+            has_e1, has_e2 = e1 != 0, e2 != 0
+            entrance[has_e1] = entrance_edge(
+                matrices[has_e1], e1[has_e1], radius[has_e1]
+            )
+            single_step = (steps == 1)[:, np.newaxis, np.newaxis]
+            exit_ = np.where(single_step, entrance, matrices)
+            exit_[has_e2] = exit_edge(exit_[has_e2], e2[has_e2], radius[has_e2])
+            table[ids, _BODY] = matrices
+            table[ids, _ENTRANCE] = entrance
+            table[ids, _EXIT] = exit_
+            self._cache_rows(ids, keys)
 
         self.changed_elements.clear()
+        self._uncoupled = None
+
+    @property
+    def uncoupled(self) -> bool:
+        """Whether all transfer matrices are uncoupled, which means that they only
+        have non-zero entries within the 2x2 blocks of the transverse planes, the
+        dispersion column and the path length row, and a unit diagonal for the
+        longitudinal plane. Block-sparse kernels are used for uncoupled lattices."""
+        if self.changed_elements:
+            self.update_step_matrices()
+        if self._uncoupled is None:
+            table = self._table
+            self._uncoupled = bool(
+                np.all(table[..., ~UNCOUPLED_MASK] == 0)
+                and np.all(table[..., 4, 4] == 1)
+                and np.all(table[..., 5, 5] == 1)
+            )
+        return self._uncoupled
+
+    def transfer_matrix(self, obj=None) -> np.ndarray:
+        """Transfer matrix through an element or a (sub-)lattice.
+
+        The transfer matrices of elements and sub-lattices are cached until one of
+        their elements changes. Consecutive repetitions of the same child are
+        exponentiated by repeated squaring instead of being multiplied step by step.
+        The products of the children of a lattice are kept in a :class:`ProductTree`,
+        so that a changed child only updates O(log n) products.
+
+        :param obj: Element or lattice. Defaults to the whole lattice.
+        :type obj: Union[Element, Lattice], optional
+        """
+        if obj is None:
+            obj = self.lattice
+
+        matrix = self._transfer_matrices.get(obj)
+        if matrix is not None:
+            return matrix
+
+        if isinstance(obj, Lattice):
+            matrix = self._product_tree(obj).root.copy()
+        else:
+            if self.changed_elements:
+                self.update_step_matrices()
+            n_steps = self.get_steps(obj)
+            body, entrance, exit_ = self._table[self._table_index[obj]]
+            if n_steps == 0:
+                matrix = IDENTITY
+            elif n_steps == 1:
+                matrix = exit_.copy()
+            else:
+                body = np.linalg.matrix_power(body, n_steps - 2)
+                matrix = np.linalg.multi_dot((exit_, body, entrance))
+
+        self._transfer_matrices[obj] = matrix
+        return matrix
+
+    def partial_matrices(self, indices, lengths) -> np.ndarray:
+        """Transfer matrices from the start of the steps `indices` over `lengths`,
+        which must not be longer than the steps. The entrance edge of a dipole is
+        included if the step is its first step, the exit edge is never included.
+        Returns an array of shape (n, 6, 6).
+
+        :param np.ndarray indices: Indices of the steps.
+        :param np.ndarray lengths: Lengths from the start of the steps.
+        """
+        self.element_indices
+        if self.changed_elements:
+            self.update_step_matrices()
+
+        indices = np.asarray(indices, dtype=np.intp)
+        lengths = np.asarray(lengths, dtype=float)
+        ids = self._slice_elements[indices]
+        k0, k1 = self._table_k0[ids], self._table_k1[ids]
+        matrices = drift_matrices(lengths)
+        quadrupoles = k1 != 0
+        matrices[quadrupoles] = quadrupole_matrices(
+            k1[quadrupoles], lengths[quadrupoles]
+        )
+
+        dipoles = (k0 != 0) & (lengths > 0)
+        if np.any(dipoles):
+            k0, lengths = k0[dipoles], lengths[dipoles]
+            steps = np.ones(lengths.size)
+            dipole = dipole_matrices(k0 * lengths, lengths, steps)
+            e1 = self._table_e1[ids[dipoles]]
+            edge = (e1 != 0) & self._slice_first[indices[dipoles]]
+            dipole[edge] = entrance_edge(dipole[edge], e1[edge], 1 / k0[edge])
+            matrices[dipoles] = dipole
+        return matrices
+
+    def _product_tree(self, lattice) -> ProductTree:
+        """Product tree over the runs of identical children of a lattice."""
+        tree = self._product_trees.get(lattice)
+        changed_children = self._changed_children.pop(lattice, ())
+        if tree is None:
+            run_indices = self._run_indices[lattice] = {}
+            leaves = []
+            for i, (_, group) in enumerate(groupby(lattice.children, key=id)):
+                child = next(group)
+                count = 1 + sum(1 for _ in group)
+                run_indices.setdefault(child, []).append((i, count))
+                leaves.append(self._run_matrix(child, count))
+            tree = self._product_trees[lattice] = ProductTree(leaves)
+        elif changed_children:
+            indices, matrices = [], []
+            for child in changed_children:
+                for i, count in self._run_indices[lattice][child]:
+                    indices.append(i)
+                    matrices.append(self._run_matrix(child, count))
+            tree.update(indices, matrices)
+        return tree
+
+    def _run_matrix(self, child, count) -> np.ndarray:
+        matrix = self.transfer_matrix(child)
+        return np.linalg.matrix_power(matrix, count) if count > 1 else matrix
+
+    def _cache_rows(self, ids, keys):
+        for i, key in zip(ids, keys):
+            self.cache.put(key, self._table[i].copy())
 
     @property
     def start_index(self) -> int:
@@ -323,7 +669,7 @@ class MatrixMethod:
     @start_index.setter
     def start_index(self, value):
         self._start_index = value
-        self._start_position_changed()
+        self.start_index_changed()
 
     @property
     def start_position(self) -> float:
@@ -334,15 +680,13 @@ class MatrixMethod:
     def start_position(self, value):
         self.start_index = np.searchsorted(self.s, value) - 1
 
-    @property
+    @cached_property("matrices", "start_index")
     def matrices_acc(self) -> np.ndarray:
         """The accumulated transfer matrices starting from start_index."""
-        if self._matrices_acc_needs_update:
-            self.update_matrices_acc()
+        matrices = np.ascontiguousarray(self.matrices)
+        if self._matrices_acc.shape != matrices.shape:
+            self._matrices_acc = np.empty(matrices.shape)
+        matrix_product_accumulated(matrices, self._matrices_acc, self.start_index or 0)
         return self._matrices_acc
 
-    def update_matrices_acc(self):
-        matrix_product_accumulated(self.matrices, self.matrices_acc, self.start_index)
-
-    def _on_matrices_accumulated_changed(self):
-        self.matrices_acc_changed = True
+    update_matrices_acc = deprecated_update("matrices_acc")
@@ -4,7 +4,7 @@ import numpy as np
 
 from .clib import matrix_product_accumulated, matrix_product_ranges
 from .matrixmethod import MatrixMethod, MATRIX_SIZE
-from .utils import Signal
+from .utils import cached_property, connect_dependencies, deprecated_update
 
 
 class TrackingMatrix(MatrixMethod):
@@ -37,11 +37,7 @@ class TrackingMatrix(MatrixMethod):
 
         self._orbit_position = np.empty(0)
         self._particle_trajectories = np.empty(0)
-        self._particle_trajectories_needs_update = True
-        self.particle_trajectories_changed = Signal(self.matrices_changed)
-        self.particle_trajectories_changed.connect(
-            self._on_particle_trajectories_changed
-        )
+        connect_dependencies(self, TrackingMatrix)
 
     @property
     def watch_points(self):
@@ -66,17 +62,9 @@ class TrackingMatrix(MatrixMethod):
         self._initial_distribution = value
         self.particle_trajectories_changed()
 
-    @property
-    def particle_trajectories(self) -> np.ndarray:
-        """Contains the 6D particle trajectories."""
-        if self._particle_trajectories_needs_update:
-            self.update_particle_trajectories()
-        return self._particle_trajectories
-
     @property
     def orbit_position(self) -> np.ndarray:
-        if self._particle_trajectories_needs_update:
-            self.update_particle_trajectories()
+        self.particle_trajectories
         return self._orbit_position
 
     @property
@@ -103,8 +91,9 @@ class TrackingMatrix(MatrixMethod):
     def delta(self) -> np.ndarray:
         return self.particle_trajectories[:, 5]
 
-    def update_particle_trajectories(self):
-        """Manually update the 6D particle trajectories"""
+    @cached_property("matrices")
+    def particle_trajectories(self) -> np.ndarray:
+        """Contains the 6D particle trajectories."""
         n_steps = self.n_steps
         n_points = n_steps + 1
         n_turns = self.n_turns
@@ -112,7 +101,7 @@ class TrackingMatrix(MatrixMethod):
         n_watch_points = len(watch_points)
         watch_all = n_watch_points == 0
         initial_distribution = self.initial_distribution
-        matrices = self.matrices
+        matrices = np.ascontiguousarray(self.matrices)
 
         if any(0 > point > n_steps for point in watch_points):
             raise ValueError("Invalid watch points!")
@@ -132,7 +121,7 @@ class TrackingMatrix(MatrixMethod):
         # TODO: implement in C
         if watch_all:
             acc_array = np.empty(matrices.shape)
-            matrix_product_accumulated(matrices, acc_array, 0)
+            matrix_product_accumulated(matrices, acc_array, 0, uncoupled=self.uncoupled)
             trajectories[0] = initial_distribution
             np.dot(acc_array, initial_distribution, out=trajectories[1:n_points])
             orbit_position[0:n_points] = self.s
@@ -149,6 +138,7 @@ class TrackingMatrix(MatrixMethod):
                     matrices,
                     to_first_point,
                     np.array([[0, watch_points[0]]], dtype=np.int32),
+                    uncoupled=self.uncoupled,
                 )
                 trajectories[0] = np.dot(to_first_point, initial_distribution)
 
@@ -163,7 +153,7 @@ class TrackingMatrix(MatrixMethod):
                 ranges[i, 0] = point
                 ranges[i - 1, 1] = point
 
-            matrix_product_ranges(matrices, acc_array, ranges)
+            matrix_product_ranges(matrices, acc_array, ranges, uncoupled=self.uncoupled)
 
             for turn in range(1, n_turns):
                 idx = turn * n_watch_points
@@ -174,7 +164,6 @@ class TrackingMatrix(MatrixMethod):
                     i = idx + j
                     np.dot(acc_array[j - 1], trajectories[i - 1], out=trajectories[i])
 
-        self._particle_trajectories_needs_update = False
+        return trajectories
 
-    def _on_particle_trajectories_changed(self):
-        self._particle_trajectories_needs_update = True
+    update_particle_trajectories = deprecated_update("particle_trajectories")
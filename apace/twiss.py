@@ -1,10 +1,20 @@
+from typing import Tuple
 import numpy as np
-from scipy.integrate import trapz, cumtrapz
-from .clib import twiss_product, matrix_product_accumulated
-from .matrixmethod import MatrixMethod
-from .utils import Signal
+from scipy.integrate import trapz
+from .clib import (
+    betatron_phase,
+    twiss_product,
+    twiss_product_soa,
+    twiss_product_streaming,
+    twiss_product_multiple,
+    matrix_product_accumulated,
+    matrix_product_accumulated_soa,
+    matrix_product_ranges,
+)
+from .matrixmethod import MatrixMethod, MATRIX_SIZE, IDENTITY
+from .utils import Signal, cached_property, connect_dependencies, deprecated_update
 from .exceptions import UnstableLatticeError
-from .classes import Dipole
+from .classes import Element, Dipole, TYPE_CODES
 
 TWO_PI = 2 * np.pi
 CONST_C = 299_792_458  # m / s
@@ -13,6 +23,160 @@ CONST_MEV_TO_J = 1.602176634e-13  # J / MeV
 CONST_MEV_TO_GAMMA = CONST_MEV_TO_J / CONST_ME / CONST_C ** 2 * 2.4
 CONST_H_BAR = 6.62607015e-34 / TWO_PI  # Js
 CONST_Q = 55 / 32 / np.sqrt(3) / CONST_C / CONST_ME * CONST_H_BAR
+AT_CHUNK_SIZE = 100_000
+"""Number of positions which are processed at once by :meth:`Twiss.at`."""
+TWISS_PARAMETERS = (
+    "beta_x",
+    "beta_y",
+    "alpha_x",
+    "alpha_y",
+    "gamma_x",
+    "gamma_y",
+    "eta_x",
+    "eta_x_dds",
+)
+"""Names of the rows of the Twiss array."""
+ELEMENT_TABLE_DTYPE = np.dtype(
+    [("s", float), ("length", float)]
+    + [(f"{name}_entrance", float) for name in TWISS_PARAMETERS]
+    + [(f"{name}_exit", float) for name in TWISS_PARAMETERS]
+    + [
+        (f"{name}_{kind}", float)
+        for name in ("beta_x", "beta_y", "eta_x")
+        for kind in ("mean", "max")
+    ]
+    + [("psi_x", float), ("psi_y", float)]
+)
+"""Fields of :meth:`Twiss.element_table`."""
+AT_TOLERANCE = 1e-9
+"""Positions closer than this (in meter) to a point are considered to be at the point
+by :meth:`Twiss.at`."""
+
+
+def periodic_twiss(m) -> np.ndarray:
+    """Calculate the initial Twiss parameter from the periodicity condition.
+
+    :param np.ndarray m: The one-turn (or one-period) transfer matrix.
+    :return: Array containing the initial Twiss parameter.
+    """
+    term_x = 2 - m[0, 0] ** 2 - 2 * m[0, 1] * m[1, 0] - m[1, 1] ** 2
+    term_y = 2 - m[2, 2] ** 2 - 2 * m[2, 3] * m[3, 2] - m[3, 3] ** 2
+    beta_x0 = np.abs(2 * m[0, 1]) / np.sqrt(term_x)
+    alpha_x0 = (m[0, 0] - m[1, 1]) / (2 * m[0, 1]) * beta_x0
+    gamma_x0 = (1 + alpha_x0 ** 2) / beta_x0
+    beta_y0 = np.abs(2 * m[2, 3]) / np.sqrt(term_y)
+    alpha_y0 = (m[2, 2] - m[3, 3]) / (2 * m[2, 3]) * beta_y0
+    gamma_y0 = (1 + alpha_y0 ** 2) / beta_y0
+    eta_x0, eta_x_dds0 = (
+        (m[0, 5] * (1 - m[1, 1]) + m[0, 1] * m[1, 5]) / (2 - m[0, 0] - m[1, 1]),
+        (m[1, 5] * (1 - m[0, 0]) + m[1, 0] * m[0, 5]) / (2 - m[0, 0] - m[1, 1]),
+    )
+
+    # TODO: Wille seems to be wrong, investigate!
+    # eta_x_dds0 = (m[1, 0] * m[0, 5] + m[1, 5] * (1 - m[0, 0])) / (2 - m[0, 0] - m[1, 1])
+    # eta_x0 = (m[0, 1] * eta_x_dds0 + m[0, 5]) / (1 - m[1, 1])
+
+    return np.array(
+        [beta_x0, beta_y0, alpha_x0, alpha_y0, gamma_x0, gamma_y0, eta_x0, eta_x_dds0]
+    )
+
+
+def twiss_transform(matrices, twiss) -> np.ndarray:
+    """Transform Twiss parameter with transfer matrices (see :func:`twiss_product`).
+
+    :param np.ndarray matrices: Transfer matrices. (n, 6, 6)
+    :param np.ndarray twiss: Twiss parameter at the start of the matrices. (..., 8, n)
+    :return: Twiss parameter at the end of the matrices. (..., 8, n)
+    """
+    m = np.moveaxis(matrices, 0, -1)
+    beta_x, beta_y, alpha_x, alpha_y, gamma_x, gamma_y, eta_x, eta_x_dds = np.moveaxis(
+        twiss, -2, 0
+    )
+    result = np.empty_like(twiss)
+    for i, (beta, alpha, gamma) in enumerate(
+        ((beta_x, alpha_x, gamma_x), (beta_y, alpha_y, gamma_y))
+    ):
+        j = 2 * i
+        m11, m12, m21, m22 = m[j, j], m[j, j + 1], m[j + 1, j], m[j + 1, j + 1]
+        result[..., i, :] = (
+            m11 ** 2 * beta - 2 * m11 * m12 * alpha + m12 ** 2 * gamma
+        )
+        result[..., 2 + i, :] = (
+            -m11 * m21 * beta + (m11 * m22 + m12 * m21) * alpha - m22 * m12 * gamma
+        )
+        result[..., 4 + i, :] = (
+            m21 ** 2 * beta - 2 * m22 * m21 * alpha + m22 ** 2 * gamma
+        )
+    result[..., 6, :] = m[0, 0] * eta_x + m[0, 1] * eta_x_dds + m[0, 5]
+    result[..., 7, :] = m[1, 0] * eta_x + m[1, 1] * eta_x_dds + m[1, 5]
+    return result
+
+
+def dipole_radiation_integrals(angle, length, e1, e2, twiss) -> np.ndarray:
+    """Closed-form synchrotron radiation integrals of sector dipoles.
+
+    Inside a sector dipole the dispersion is (eta, eta') = R(s) (u0 + v(s)) with
+    v(s) = (-(1 - cos hs) / h, sin hs), so that H(s) = H0 + 2 (G0 u0) v + v G0 v,
+    where u0 is the dispersion and G0 the Twiss matrix after the entrance edge.
+
+    :param np.ndarray angle: Bending angles of the dipoles.
+    :param np.ndarray length: Lengths of the dipoles.
+    :param np.ndarray e1: Entrance edge angles of the dipoles.
+    :param np.ndarray e2: Exit edge angles of the dipoles.
+    :param np.ndarray twiss: Twiss parameter at the entrance of the dipoles (in front
+                             of the edge). (..., 8, n_dipoles)
+    :return: Contributions of each dipole to I1 - I5. (..., 5, n_dipoles)
+    """
+    h = angle / length
+    beta, alpha, gamma = twiss[..., 0, :], twiss[..., 2, :], twiss[..., 4, :]
+    eta, eta_dds = twiss[..., 6, :], twiss[..., 7, :]
+
+    # entrance edge focusing
+    k = np.tan(e1) * h
+    alpha, gamma = alpha - k * beta, gamma - 2 * k * alpha + k ** 2 * beta
+    eta_dds = eta_dds + k * eta
+
+    sin, cos, sin_2 = np.sin(angle), np.cos(angle), np.sin(2 * angle)
+    int_v1 = -(angle - sin) / h ** 2
+    int_v2 = (1 - cos) / h
+    int_v1_v1 = (1.5 * length - 2 * sin / h + sin_2 / (4 * h)) / h ** 2
+    int_v1_v2 = -((1 - cos) - 0.5 * sin ** 2) / h ** 2
+    int_v2_v2 = 0.5 * length - sin_2 / (4 * h)
+    curly_h = gamma * eta ** 2 + 2 * alpha * eta * eta_dds + beta * eta_dds ** 2
+    int_curly_h = (
+        curly_h * length
+        + 2 * (gamma * eta + alpha * eta_dds) * int_v1
+        + 2 * (alpha * eta + beta * eta_dds) * int_v2
+        + gamma * int_v1_v1
+        + 2 * alpha * int_v1_v2
+        + beta * int_v2_v2
+    )
+
+    eta_exit = eta * cos + eta_dds * sin / h + (1 - cos) / h
+    i1 = eta * sin + eta_dds * (1 - cos) / h + (angle - sin) / h
+    i2 = np.broadcast_to(h ** 2 * length, i1.shape)
+    i3 = np.broadcast_to(np.abs(h ** 3) * length, i1.shape)
+    i4 = h ** 2 * (i1 - np.tan(e1) * eta - np.tan(e2) * eta_exit)
+    i5 = np.abs(h ** 3) * int_curly_h
+    return np.stack((i1, i2, i3, i4, i5), axis=-2)
+
+
+def poleface_effect(matrix_method, eta_x):
+    """Poleface effect of the dipole edges on the fourth synchrotron radiation
+    integral (see MAD-X source code or SLAC-Pub-1193).
+
+    :param MatrixMethod matrix_method: Matrix method of the lattice.
+    :param np.ndarray eta_x: Horizontal dispersion. (..., n_steps + 1)
+    """
+    table = matrix_method.lattice.table
+    steps = matrix_method.sequence_steps
+    dipoles = (table.type == TYPE_CODES[Dipole]) & (steps > 0)
+    starts = matrix_method.sequence_starts[dipoles]
+    ends = starts + steps[dipoles]  # TODO: is + 1 correct?
+    k0 = table.angle[dipoles] / table.length[dipoles]
+    e1, e2 = table.e1[dipoles], table.e2[dipoles]
+    p_effect = np.tan(e1) * eta_x[..., starts] + np.tan(e2) * eta_x[..., ends]
+    return np.sum(k0 ** 2 * p_effect, axis=-1)
 
 
 class Twiss(MatrixMethod):
@@ -24,95 +188,82 @@ class Twiss(MatrixMethod):
                       using the periodicity condition.
     :type start_idx: int, optional
     :param initial: Initial Twiss parameter, otherwise periodic solution is used.
+                    An array of shape (m, 8) calculates the Twiss parameter for m
+                    initial conditions at once, so that the Twiss functions (and
+                    derived values) get an additional first axis of size m.
     :type initial: nd.ndarray, optional
     :param energy: Energy of the beam in mev
     :type energy: float, optional
+    :param bool use_periodicity: Calculate the periodic solution only on one period of
+                                 the lattice (see :attr:`Lattice.periodicity`) and tile
+                                 or scale the results. (Default=False)
+    :param bool parallel: Flag to utilize multiple cpu cores for the accumulation of
+                          the transfer matrices and the Twiss product. (Default=False)
+    :param bool streaming: Feed the running product of the transfer matrices directly
+                           into the Twiss product, so that :attr:`accumulated_array` is
+                           only calculated if it is accessed. (Default=False)
+    :param observation_points: Elements (or their names), at whose exits, or point
+                               indices, at which :attr:`observation_array` is
+                               calculated.
+    :type observation_points: array-like, optional
+    :param str radiation_integrals: Calculate the synchrotron radiation integrals by
+                                    integrating over all steps ("numeric") or with the
+                                    closed-form solution for each dipole
+                                    ("analytic"), which does not depend on the step
+                                    size. (Default="numeric")
     """
 
-    def __init__(self, lattice, *, initial=None, start_idx=0, **kwargs):
+    def __init__(
+        self,
+        lattice,
+        *,
+        initial=None,
+        start_idx=0,
+        use_periodicity=False,
+        parallel=False,
+        streaming=False,
+        observation_points=None,
+        radiation_integrals="numeric",
+        **kwargs,
+    ):
         super().__init__(lattice, **kwargs)
+        if radiation_integrals not in ("numeric", "analytic"):
+            raise ValueError(
+                f"Unknown radiation integrals {radiation_integrals!r}! "
+                "(Expected 'numeric' or 'analytic')"
+            )
 
-        self._start_idx = start_idx
-        self.start_idx_changed = Signal()  # TODO: is currently unused
-        """Gets emitted when the start index changes"""
+        if streaming and self.layout == "soa":
+            raise ValueError("The streaming mode is only supported for layout 'aos'.")
 
-        self.one_turn_matrix_changed = Signal(
-            self.start_idx_changed, self.matrices_changed
-        )
-        """Gets emitted when the one turn matrix changes."""
-        self.one_turn_matrix_changed.connect(self._on_one_turn_matrix_changed)
-        self._one_turn_matrix_needs_update = True
-        self._one_turn_matrix = np.empty(0)
-        self._accumulated_array = np.empty(0)
-        self._term_x = None
-        self._term_y = None
+        self._use_periodicity = use_periodicity
+        self.radiation_integrals = radiation_integrals
+        """Method used for the synchrotron radiation integrals."""
+        self.parallel = parallel
+        """Flag to utilize multiple cpu cores."""
+        self.streaming = streaming
+        """Flag to not materialize the accumulated transfer matrices."""
 
-        self.twiss_array_changed = Signal(self.one_turn_matrix_changed)
-        """Gets emitted when the twiss functions change."""
-        self.twiss_array_changed.connect(self._on_twiss_array_changed)
-        self._twiss_array_needs_update = True
+        self._start_idx = start_idx
+        self.start_idx_changed = Signal()
+        """Gets emitted when the start index changes."""
+        # only emitted if the start index invalidates the periodic solution
+        self._start_idx_changed = Signal()
+        self._accumulated_array = np.empty(0)
+        self._accumulated_origin = 0
         self._twiss_array = np.empty(0)
         self._initial_twiss = initial
-
-        self.psi_changed = Signal(self.twiss_array_changed)
-        """Gets emitted when the betatron phase changes."""
-        self.psi_changed.connect(self._on_psi_changed)
-        self._psi_needs_update = True
-        self._psi_x = np.empty(0)
-        self._psi_y = np.empty(0)
-        self._tune_x = None
-        self._tune_y = None
-
-        self.tune_fractional_changed = Signal(self.one_turn_matrix_changed)
-        """Gets emitted when the fractional tune changes."""
-        self.tune_fractional_changed.connect(self._on_tune_fractional_changed)
-        self._tune_fractional_needs_update = True
-        self._tune_x_fractional = None
-        self._tune_y_fractional = None
-
-        self.alpha_c_changed = Signal(self.matrices_changed, self.twiss_array_changed)
-        self.tune_fractional_changed.connect(self._on_alpha_c_changed)
-        """Gets emitted when the natural chormaticity changes."""
-        self._alpha_c_needs_update = True
-        self._alpha_c = None
-
+        self._observation_psi = np.empty(0)
+        connect_dependencies(self, Twiss)
+        self.tune_fractional_changed = Signal(
+            self.tune_x_fractional_changed, self.tune_y_fractional_changed
+        )
+        """Gets emitted when one of the fractional tunes changes."""
         self.chromaticity_changed = Signal(
-            self.matrices_changed, self.twiss_array_changed
+            self.chromaticity_x_changed, self.chromaticity_y_changed
         )
-        self.tune_fractional_changed.connect(self._on_chromaticity_changed)
-        """Gets emitted when the natural chormaticity changes."""
-        self._chromaticity_needs_update = True
-        self._chromaticity_x = None
-        self._chromaticity_y = None
-
-        self._emittance = None
-        self._emittance_needs_update = True
-        self._emittance_changed = Signal(self.twiss_array_changed)
-        self._emittance_changed.connect(self._on_emittance_changed)
-        self._curly_h = None
-        self._curly_h_needs_update = True
-        self._curly_h_changed = Signal(self.twiss_array_changed)
-        self._curly_h_changed.connect(self._on_curly_h_changed)
-        self._i1 = None
-        self._i1_needs_update = True
-        self._i1_changed = Signal(self.twiss_array_changed, self.matrices_changed)
-        self._i1_changed.connect(self._on_i1_changed)
-        self._i2 = None
-        self._i2_needs_update = True
-        self._i2_changed = Signal(self.matrices_changed)
-        self._i2_changed.connect(self._on_i2_changed)
-        self._i3 = None
-        self._i3_needs_update = True
-        self._i3_changed = Signal(self.twiss_array_changed, self.matrices_changed)
-        self._i3_changed.connect(self._on_i3_changed)
-        self._i4 = None
-        self._i4_needs_update = True
-        self._i4_changed = Signal(self.twiss_array_changed, self.matrices_changed)
-        self._i4_changed.connect(self._on_i4_changed)
-        self._i5 = None
-        self._i5_needs_update = True
-        self._i5_changed = Signal(self.twiss_array_changed, self.matrices_changed)
-        self._i5_changed.connect(self._on_i5_changed)
+        """Gets emitted when one of the natural chromaticities changes."""
+        self.observation_points = observation_points
 
     @property
     def start_idx(self) -> int:
@@ -122,45 +273,157 @@ class Twiss(MatrixMethod):
 
     @start_idx.setter
     def start_idx(self, value):
-        if value >= self.n_steps:
+        if not 0 <= value < self.n_steps:
             raise ValueError(
-                f"Start index {value} is too high! (Maximum {self.n_kicks})"
+                f"Start index {value} is out of range! (0 to {self.n_steps - 1})"
             )
 
+        old_start_idx = self._period_start_idx
         self._start_idx = value
+        # the periodic solution does not depend on the start index, only the one-turn
+        # matrix has to be re-originated by a similarity transform
+        cache = self._cache
+        if (
+            self._initial_twiss is None
+            and "twiss_array" in cache
+            and "one_turn_matrix" in cache
+        ):
+            a = self._partial_matrix(old_start_idx, self._period_start_idx)
+            cache["one_turn_matrix"] = np.linalg.multi_dot(
+                (a, cache["one_turn_matrix"], np.linalg.inv(a))
+            )
+        else:
+            self._start_idx_changed()
         self.start_idx_changed()
 
+    @property
+    def n_periods(self) -> int:
+        """Number of periods the periodic solution is calculated on. Is one unless
+        `use_periodicity` is set and no initial Twiss parameter are given."""
+        if self._use_periodicity and self._initial_twiss is None:
+            return self.lattice.periodicity
+        return 1
+
+    @property
+    def _period_start_idx(self) -> int:
+        return self.start_idx % (self.n_steps // self.n_periods)
+
     @property
     def accumulated_array(self) -> np.ndarray:
-        """Contains accumulated transfer matrices."""
-        if self._one_turn_matrix_needs_update:
-            self.update_one_turn_matrix()
-        return self._accumulated_array
+        """Contains accumulated transfer matrices. (Only for the first period if
+        `use_periodicity` is set.)"""
+        self._accumulated_matrices
+        if self._accumulated_origin != self._period_start_idx:
+            self._reorigin_accumulated_array()
+        return self._accumulated_view
 
     @property
+    def _accumulated_view(self) -> np.ndarray:
+        if self.layout == "soa":
+            return self._accumulated_array.transpose(2, 0, 1)
+        return self._accumulated_array
+
+    def _partial_matrix(self, from_idx, to_idx) -> np.ndarray:
+        """Transfer matrix from the step `from_idx` to `to_idx` (exclusive) within a
+        period. Is taken from the accumulated array if it is available."""
+        if from_idx == to_idx:
+            return IDENTITY
+        if "_accumulated_matrices" in self._cache:
+            origin = self._accumulated_origin
+            accumulated = self._accumulated_view
+            a_to = IDENTITY if to_idx == origin else accumulated[to_idx - 1]
+            if from_idx == origin:
+                return a_to
+            return np.dot(a_to, np.linalg.inv(accumulated[from_idx - 1]))
+
+        n = self.n_steps // self.n_periods
+        m = np.empty((1, MATRIX_SIZE, MATRIX_SIZE))
+        ranges = np.array([[from_idx, to_idx]], dtype=np.int32)
+        matrix_product_ranges(
+            np.ascontiguousarray(self.matrices[:n]), m, ranges, uncoupled=self.uncoupled
+        )
+        return m[0]
+
+    def _reorigin_accumulated_array(self):
+        """Re-originate the accumulated array at the (period) start index. Instead of
+        a new matrix chain, this only needs one matrix product per step:
+
+        The steps after the new start are multiplied by A^-1 and the steps before by
+        P A^-1, where A is the transfer matrix from the old to the new start and P is
+        the transfer matrix of the whole period."""
+        accumulated = self._accumulated_view
+        old, new = self._accumulated_origin, self._period_start_idx
+        n = accumulated.shape[0]
+        a_inverse = np.linalg.inv(accumulated[new - 1])
+        before_new = (np.arange(n) - old) % n < (new - old) % n
+        after_new = ~before_new
+        before_matrix = np.dot(accumulated[old - 1], a_inverse)
+        accumulated[before_new] = np.matmul(accumulated[before_new], before_matrix)
+        accumulated[after_new] = np.matmul(accumulated[after_new], a_inverse)
+        self._accumulated_origin = new
+
+    @cached_property("_start_idx", "matrices")
+    def _accumulated_matrices(self) -> np.ndarray:
+        """The accumulated transfer matrices in the memory layout of the matrices. If
+        the lattice is periodic, they are only calculated for the first period. Are
+        re-originated by :attr:`accumulated_array` if only the start index changes."""
+        n = self.n_steps // self.n_periods
+        if self.layout == "soa":
+            shape = MATRIX_SIZE, MATRIX_SIZE, n
+            if self._accumulated_array.shape != shape:
+                self._accumulated_array = np.empty(shape)
+
+            matrix_product_accumulated_soa(
+                self.matrices.transpose(1, 2, 0),
+                self._accumulated_array,
+                self._period_start_idx,
+                uncoupled=self.uncoupled,
+            )
+        else:
+            matrix_array = self.matrices[:n]
+            if self._accumulated_array.shape != matrix_array.shape:
+                self._accumulated_array = np.empty(matrix_array.shape)
+
+            matrix_product_accumulated(
+                matrix_array,
+                self._accumulated_array,
+                self._period_start_idx,
+                parallel=self.parallel,
+                uncoupled=self.uncoupled,
+            )
+        self._accumulated_origin = self._period_start_idx
+        return self._accumulated_array
+
+    @cached_property("_start_idx", "matrices")
     def one_turn_matrix(self) -> np.ndarray:
-        """The transfer matrix for a full turn."""
-        if self._one_turn_matrix_needs_update:
-            self.update_one_turn_matrix()
-        return self._one_turn_matrix
+        """The transfer matrix for a full turn. If the start index is zero, the cached
+        transfer matrices of the sub-lattices are used. Otherwise it is taken from the
+        accumulated array."""
+        if self.start_idx == 0:
+            return self.transfer_matrix()
 
-    @property
+        m = self._period_matrix()
+        if self.n_periods > 1:
+            m = np.linalg.matrix_power(m, self.n_periods)
+        return m
+
+    update_one_turn_matrix = deprecated_update("one_turn_matrix")
+
+    @cached_property("one_turn_matrix")
     def term_x(self) -> float:
         """Corresponds to :math:`2 - m_{11}^2 - 2 m_{12} m_{21} - m_{22}^2`, where :math:`m` is the one turn matrix.
         Can be used to calculate the initial :attr:`beta_x` value :math:`\\beta_{x0} = |2 m_{12}| / \\sqrt{term_x}`.
         If :attr:`term_x` > 0, this means that there exists a periodic solution within the horizontal plane."""
-        if self._one_turn_matrix_needs_update:
-            self.update_one_turn_matrix()
-        return self._term_x
+        m = self.one_turn_matrix
+        return 2 - m[0, 0] ** 2 - 2 * m[0, 1] * m[1, 0] - m[1, 1] ** 2
 
-    @property
+    @cached_property("one_turn_matrix")
     def term_y(self) -> float:
         """Corresponds to :math:`2 - m_{33}^2 - 2 m_{34} m_{43} - m_{44}^2`, where :math:`m` is the one turn matrix.
         Can be used to calculate the initial :attr:`beta_y` value :math:`\\beta_{y0} = |2 m_{12}| / \\sqrt{term_y}`.
         If :attr:`term_y` > 0, this means that there exists a periodic solution within the vertical plane."""
-        if self._one_turn_matrix_needs_update:
-            self.update_one_turn_matrix()
-        return self._term_y
+        m = self.one_turn_matrix
+        return 2 - m[2, 2] ** 2 - 2 * m[2, 3] * m[3, 2] - m[3, 3] ** 2
 
     @property
     def stable_x(self) -> bool:
@@ -177,321 +440,546 @@ class Twiss(MatrixMethod):
         """Periodicity condition :attr:`term_x` > 0 and :attr:`term_y` > 0 for a stable solution in both planes."""
         return self.term_x > 0 and self.term_y > 0
 
-    def update_one_turn_matrix(self):
-        """Manually update the one turn matrix and the accumulated array."""
-        matrix_array = self.matrices
-        if self._accumulated_array.shape[0] != self.n_steps:
-            self._accumulated_array = np.empty(matrix_array.shape)
-
-        matrix_product_accumulated(
-            matrix_array, self._accumulated_array, self.start_idx
-        )
-        self._one_turn_matrix = m = self._accumulated_array[self.start_idx - 1]
-        self._term_x = 2 - m[0, 0] ** 2 - 2 * m[0, 1] * m[1, 0] - m[1, 1] ** 2
-        self._term_y = 2 - m[2, 2] ** 2 - 2 * m[2, 3] * m[3, 2] - m[3, 3] ** 2
-        self._one_turn_matrix_needs_update = False
-
-    def _on_one_turn_matrix_changed(self):
-        self._one_turn_matrix_needs_update = True
-
     @property
     def initial_twiss(self) -> np.ndarray:
         """Array containing the initial twiss parameter."""
-        if self._twiss_array_needs_update:
-            self.update_twiss_array()
+        self.twiss_array
         return self._initial_twiss
 
-    @property
+    @cached_property("one_turn_matrix", "_accumulated_matrices")
     def twiss_array(self) -> np.ndarray:
         """Contains the twiss parameter."""
-        if self._twiss_array_needs_update:
-            self.update_twiss_array()
-        return self._twiss_array
-
-    def update_twiss_array(self):
-        """Manually update the twiss_array."""
-        n_points = self.n_steps + 1
-        if self._twiss_array.shape[0] != n_points:
-            self._twiss_array = np.empty((8, n_points))
+        shape = 8, self.n_steps + 1
+        if self._initial_twiss is not None and np.ndim(self._initial_twiss) == 2:
+            shape = (len(self._initial_twiss),) + shape
+        if self._twiss_array.shape != shape:
+            self._twiss_array = np.empty(shape)
 
+        n_periods = self.n_periods
         if self._initial_twiss is None:
             if not self.stable:
                 raise UnstableLatticeError(self)
 
-            m = self.one_turn_matrix
-            beta_x0 = np.abs(2 * m[0, 1]) / np.sqrt(self.term_x)
-            alpha_x0 = (m[0, 0] - m[1, 1]) / (2 * m[0, 1]) * beta_x0
-            gamma_x0 = (1 + alpha_x0 ** 2) / beta_x0
-            beta_y0 = np.abs(2 * m[2, 3]) / np.sqrt(self.term_y)
-            alpha_y0 = (m[2, 2] - m[3, 3]) / (2 * m[2, 3]) * beta_y0
-            gamma_y0 = (1 + alpha_y0 ** 2) / beta_y0
-            eta_x0, eta_x_dds0 = (
-                (m[0, 5] * (1 - m[1, 1]) + m[0, 1] * m[1, 5]) / (2 - m[0, 0] - m[1, 1]),
-                (m[1, 5] * (1 - m[0, 0]) + m[1, 0] * m[0, 5]) / (2 - m[0, 0] - m[1, 1]),
+            if n_periods > 1:
+                initial_twiss = periodic_twiss(self._period_matrix())
+            else:
+                initial_twiss = periodic_twiss(self.one_turn_matrix)
+        else:
+            initial_twiss = self._initial_twiss
+
+        if n_periods > 1:
+            n_period = self.n_steps // n_periods
+            period_array = np.empty((8, n_period + 1))
+            self._twiss_product(initial_twiss, period_array, self._period_start_idx)
+            periods = self._twiss_array[:, :-1].reshape(8, n_periods, n_period)
+            periods[:] = period_array[:, np.newaxis, :-1]
+            self._twiss_array[:, -1] = period_array[:, -1]
+        else:
+            self._twiss_product(initial_twiss, self._twiss_array, self.start_idx)
+        return self._twiss_array
+
+    update_twiss_array = deprecated_update("twiss_array")
+
+    def _period_matrix(self) -> np.ndarray:
+        """Transfer matrix of one period starting at the (period) start index."""
+        if not self.streaming:
+            return self.accumulated_array[self._period_start_idx - 1]
+
+        n = self.n_steps // self.n_periods
+        start = self._period_start_idx
+        m = np.empty((1, MATRIX_SIZE, MATRIX_SIZE))
+        ranges = np.array([[start, start]], dtype=np.int32)
+        matrix_product_ranges(self.matrices[:n], m, ranges, uncoupled=self.uncoupled)
+        return m[0]
+
+    def _twiss_product(self, initial_twiss, twiss_array, from_idx):
+        if twiss_array.ndim == 3:
+            twiss_product_multiple(
+                np.ascontiguousarray(self.accumulated_array),
+                np.ascontiguousarray(initial_twiss, dtype=float),
+                twiss_array,
+                from_idx,
+            )
+            return
+
+        if self.streaming:
+            n = twiss_array.shape[1] - 1
+            twiss_product_streaming(
+                self.matrices[:n],
+                initial_twiss,
+                twiss_array,
+                from_idx,
+                uncoupled=self.uncoupled,
             )
+            return
 
-            # TODO: Wille seems to be wrong, investigate!
-            # eta_x_dds0 = (m[1, 0] * m[0, 5] + m[1, 5] * (1 - m[0, 0])) / (2 - m[0, 0] - m[1, 1])
-            # eta_x0 = (m[0, 1] * eta_x_dds0 + m[0, 5]) / (1 - m[1, 1])
-
-            initial_twiss = np.array(
-                [
-                    beta_x0,
-                    beta_y0,
-                    alpha_x0,
-                    alpha_y0,
-                    gamma_x0,
-                    gamma_y0,
-                    eta_x0,
-                    eta_x_dds0,
-                ]
+        self.accumulated_array
+        if self.layout == "soa":
+            twiss_product_soa(
+                self._accumulated_array, initial_twiss, twiss_array, from_idx
             )
         else:
-            initial_twiss = self._initial_twiss
+            twiss_product(
+                self._accumulated_array,
+                initial_twiss,
+                twiss_array,
+                from_idx,
+                parallel=self.parallel,
+            )
 
-        twiss_product(
-            self.accumulated_array, initial_twiss, self._twiss_array, self.start_idx
-        )
+    @cached_property("s")
+    def position_index(self) -> Tuple[float, np.ndarray, int]:
+        """Divides the lattice into bins of equal size, one per point. Contains the
+        bin size, the index of the step at the start of each bin and the maximum
+        number of points within a bin. Used by :meth:`step_indices` to locate the steps
+        of positions without a binary search."""
+        s = self.s
+        n_bins = s.size
+        bin_size = s[-1] / n_bins
+        bins = np.arange(n_bins) * bin_size
+        index = np.searchsorted(s, bins, side="right") - 1
+        depth = int(np.max(np.diff(index, append=s.size - 1)))
+        return bin_size, index, depth
+
+    def step_indices(self, s) -> np.ndarray:
+        """Indices of the points, which are the last points at or before the
+        positions s. Positions after the last point give the index of the last point.
+
+        The positions are looked up in :attr:`position_index` and then moved forward
+        over the points within their bin. If the steps are so uneven that a bin
+        contains more points than a binary search needs comparisons, a binary search
+        is used instead.
+
+        :param np.ndarray s: Positions within [0, length of the lattice].
+        """
+        bin_size, index, depth = self.position_index
+        s_points = self.s
+        last = s_points.size - 1
+        if depth > np.log2(s_points.size):
+            return np.minimum(np.searchsorted(s_points, s, side="right") - 1, last)
+
+        bins = np.minimum((s / bin_size).astype(np.intp), index.size - 1)
+        indices = index[bins]
+        for _ in range(depth):
+            next_indices = np.minimum(indices + 1, last)
+            indices = np.where(s >= s_points[next_indices], next_indices, indices)
+        return indices
+
+    def at(self, s, chunk_size=AT_CHUNK_SIZE) -> np.ndarray:
+        """Twiss parameter at arbitrary positions. The Twiss parameter are propagated
+        exactly from the start of the enclosing step (see
+        :meth:`MatrixMethod.partial_matrices`), so that even one step per element
+        (element-boundary mode) gives exact values inside the elements.
+
+        :param s: Positions within [0, length of the lattice].
+        :type s: array-like
+        :param int chunk_size: Number of positions which are processed at once.
+        :return: Array of Twiss parameter at the positions. (8, len(s))
+        """
+        s = np.atleast_1d(np.asarray(s, dtype=float))
+        end = self.s[-1]
+        if np.any((s < 0) | (s > end + AT_TOLERANCE)):
+            raise ValueError(f"Positions must be within [0, {end}].")
+
+        twiss_array = self.twiss_array
+        result = np.empty(twiss_array.shape[:-1] + s.shape)
+        for start in range(0, s.size, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            result[..., chunk] = self._at(np.minimum(s[chunk], end), twiss_array)
+        return result
+
+    def _at(self, s, twiss_array) -> np.ndarray:
+        s_points = self.s
+        n_steps = self.n_steps
+        indices = self.step_indices(s)
+        # positions at the boundaries of the steps (up to rounding errors) use the
+        # values of the points, so that the exit edges are included at the end and
+        # the entrance edges are excluded at the start of the dipoles
+        next_indices = np.minimum(indices + 1, n_steps)
+        at_next = s_points[next_indices] - s < AT_TOLERANCE
+        indices = np.where(at_next, next_indices, indices)
+        lengths = s - s_points[indices]
+        lengths[lengths < AT_TOLERANCE] = 0
+        twiss = twiss_array[..., indices]
+        inside = (lengths > 0) & (indices < n_steps)
+        if np.any(inside):
+            matrices = self.partial_matrices(indices[inside], lengths[inside])
+            twiss[..., inside] = twiss_transform(matrices, twiss[..., inside])
+        return twiss
+
+    def element_table(self) -> np.ndarray:
+        """Summary of the optical functions for each element of the lattice sequence
+        as structured array (see :data:`ELEMENT_TABLE_DTYPE`). Contains the position s
+        and the length of the elements, the Twiss parameter at their entrance and
+        exit (e.g. beta_x_entrance), the mean and maximum of beta_x, beta_y and eta_x
+        (e.g. beta_x_mean) and the phase advance across the elements (psi_x, psi_y).
+        The mean is the integral over the element divided by its length."""
+        return self._element_table
+
+    @cached_property("twiss_array")
+    def _element_table(self) -> np.ndarray:
+        starts = self.sequence_starts
+        ends = starts + self.sequence_steps
+        s = self.s
+        twiss_array = self.twiss_array
+        table = np.empty(twiss_array.shape[:-2] + starts.shape, ELEMENT_TABLE_DTYPE)
+        table["s"] = s[starts]
+        table["length"] = length = s[ends] - s[starts]
+        for i, name in enumerate(TWISS_PARAMETERS):
+            table[f"{name}_entrance"] = twiss_array[..., i, starts]
+            table[f"{name}_exit"] = twiss_array[..., i, ends]
+
+        # the points of consecutive elements overlap at their boundary, therefore the
+        # maximum is reduced over interleaved boundaries and every second value is used
+        values = twiss_array[..., [0, 1, 6], :]
+        padded = np.concatenate((values, values[..., -1:]), axis=-1)
+        boundaries = np.stack((starts, ends + 1), axis=-1).ravel()
+        maximum = np.maximum.reduceat(padded, boundaries, axis=-1)[..., ::2]
+
+        # integrate with the trapezoidal rule, elements without steps are padded with
+        # a zero step at the end of the lattice
+        steps = 0.5 * (values[..., 1:] + values[..., :-1]) * self.step_size
+        steps = np.concatenate((steps, np.zeros(steps.shape[:-1] + (1,))), axis=-1)
+        integral = np.add.reduceat(steps, starts, axis=-1)
+        has_length = length > 0
+        mean = values[..., starts].copy()
+        mean[..., has_length] = integral[..., has_length] / length[has_length]
+        for i, name in enumerate(("beta_x", "beta_y", "eta_x")):
+            table[f"{name}_mean"] = mean[..., i, :]
+            table[f"{name}_max"] = maximum[..., i, :]
+
+        table["psi_x"] = self.psi_x[..., ends] - self.psi_x[..., starts]
+        table["psi_y"] = self.psi_y[..., ends] - self.psi_y[..., starts]
+        return table
+
+    @property
+    def observation_points(self) -> list:
+        """Elements (or their names), at whose exits, or point indices, at which
+        :attr:`observation_array` is calculated."""
+        return self._observation_points
+
+    @observation_points.setter
+    def observation_points(self, value):
+        self._observation_points = [] if value is None else list(value)
+        self.observation_array_changed()
+
+    @property
+    def observation_indices(self) -> np.ndarray:
+        """Point indices of the observation points in the order of
+        :attr:`observation_array`, which starts at :attr:`start_idx`."""
+        indices = []
+        for point in self._observation_points:
+            if isinstance(point, (str, Element)):
+                element = self.lattice[point] if isinstance(point, str) else point
+                n_steps = self.get_steps(element)
+                pos = self.element_indices[element]
+                indices.extend(i + 1 for i in pos[n_steps - 1 :: n_steps])
+            else:
+                indices.append(point)
+        indices = np.array(indices, dtype=np.intp)
+        return indices[np.argsort(self._start_distance(indices), kind="stable")]
+
+    def _start_distance(self, indices) -> np.ndarray:
+        """Number of steps from the start index to the point indices. The point
+        after the last step is at the end of the turn (not at the start)."""
+        n_steps = self.n_steps
+        distance = (indices - self.start_idx) % n_steps
+        distance[(distance == 0) & (indices != self.start_idx)] = n_steps
+        return distance
+
+    @cached_property("start_idx", "matrices")
+    def observation_array(self) -> np.ndarray:
+        """Twiss parameter at the observation points. (8, n_points) or (m, 8, n_points)
+        for m initial conditions. Only the transfer matrices between consecutive points
+        are calculated (using range products), so that neither
+        :attr:`accumulated_array` nor :attr:`twiss_array` are needed."""
+        n_steps = self.n_steps
+        distance = self._start_distance(self.observation_indices)
+        bounds = self.start_idx + np.concatenate(([0], distance, [n_steps]))
+        ranges = np.column_stack((bounds[:-1], bounds[1:])) % n_steps
+        ranges = ranges.astype(np.int32)
+        n_segments = ranges.shape[0]
+
+        # a range with the same start and end is a full turn, unless it is empty
+        segments = np.empty((n_segments, MATRIX_SIZE, MATRIX_SIZE))
+        empty = np.diff(bounds) == 0
+        segments[empty] = IDENTITY
+        matrices = np.ascontiguousarray(self.matrices)
+        tmp = np.empty((np.count_nonzero(~empty), MATRIX_SIZE, MATRIX_SIZE))
+        matrix_product_ranges(matrices, tmp, ranges[~empty], uncoupled=self.uncoupled)
+        segments[~empty] = tmp
+
+        accumulated = np.empty_like(segments)
+        matrix_product_accumulated(segments, accumulated, 0)
+        if self._initial_twiss is None:
+            m = accumulated[-1]
+            term_x = 2 - m[0, 0] ** 2 - 2 * m[0, 1] * m[1, 0] - m[1, 1] ** 2
+            term_y = 2 - m[2, 2] ** 2 - 2 * m[2, 3] * m[3, 2] - m[3, 3] ** 2
+            if not (term_x > 0 and term_y > 0):
+                raise UnstableLatticeError(self)
+            initial_twiss = periodic_twiss(m)
+        else:
+            initial_twiss = np.asarray(self._initial_twiss, dtype=float)
+
+        # the first point of twiss is the start, the others are the observation points
+        if initial_twiss.ndim == 2:
+            twiss = np.empty((len(initial_twiss), 8, n_segments))
+            initial_twiss = np.ascontiguousarray(initial_twiss)
+            twiss_product_multiple(accumulated[:-1], initial_twiss, twiss, 0)
+        else:
+            twiss = np.empty((8, n_segments))
+            twiss_product(accumulated[:-1], initial_twiss, twiss, 0)
+
+        # phase advance through each segment from the Twiss parameter at its start
+        psi = np.empty(twiss.shape[:-2] + (2, n_segments - 1))
+        for plane, (i, beta, alpha) in enumerate(((0, 0, 2), (2, 1, 3))):
+            m11, m12 = segments[:-1, i, i], segments[:-1, i, i + 1]
+            beta, alpha = twiss[..., beta, :-1], twiss[..., alpha, :-1]
+            phase = np.arctan2(m12, beta * m11 - alpha * m12)
+            psi[..., plane, :] = np.cumsum(phase % TWO_PI, axis=-1)
+        self._observation_psi = psi
+        return twiss[..., 1:]
 
-        self._twiss_array_needs_update = False
+    @property
+    def observation_psi_x(self) -> np.ndarray:
+        """Horizontal betatron phase at the observation points, relative to the start
+        index. Is calculated from the transfer matrices between the points and
+        assumes phase advances below 2 pi between consecutive points."""
+        self.observation_array
+        return self._observation_psi[..., 0, :]
 
-    def _on_twiss_array_changed(self):
-        self._twiss_array_needs_update = True
+    @property
+    def observation_psi_y(self) -> np.ndarray:
+        """Vertical betatron phase at the observation points (see
+        :attr:`observation_psi_x`)."""
+        self.observation_array
+        return self._observation_psi[..., 1, :]
 
     @property
     def beta_x(self) -> np.ndarray:
         """Horizontal beta function."""
-        return self.twiss_array[0]
+        return self.twiss_array[..., 0, :]
 
     @property
     def beta_y(self) -> np.ndarray:
         """Vertical beta function."""
-        return self.twiss_array[1]
+        return self.twiss_array[..., 1, :]
 
     @property
     def alpha_x(self) -> np.ndarray:
         """Horizontal alpha function."""
-        return self.twiss_array[2]
+        return self.twiss_array[..., 2, :]
 
     @property
     def alpha_y(self) -> np.ndarray:
         """Vertical alpha function."""
-        return self.twiss_array[3]
+        return self.twiss_array[..., 3, :]
 
     # TODO: is it necessary to calculate gamma in C-code as it is g = (1 + a**2) / b
     @property
     def gamma_x(self) -> np.ndarray:
         """Horizontal gamma function."""
-        return self.twiss_array[4]
+        return self.twiss_array[..., 4, :]
 
     @property
     def gamma_y(self) -> np.ndarray:
         """Vertical gamma function."""
-        return self.twiss_array[5]
+        return self.twiss_array[..., 5, :]
 
     @property
     def eta_x(self) -> np.ndarray:
         """Horizontal dispersion function."""
-        return self.twiss_array[6]
+        return self.twiss_array[..., 6, :]
 
     @property
     def eta_x_dds(self) -> np.ndarray:
         """Derivative of the horizontal dispersion with respect to s."""
-        return self.twiss_array[7]
+        return self.twiss_array[..., 7, :]
+
+    @cached_property("twiss_array")
+    def psi(self) -> np.ndarray:
+        """Horizontal and vertical betatron phase. (2, n) The phase advance of each
+        step is calculated exactly from its transfer matrix and the Twiss parameter at
+        its entrance, so that it does not depend on the step size."""
+        # the phase advance of one period is repeated with an offset for each period
+        n_periods = self.n_periods
+        n_period = self.n_steps // n_periods
+        matrices = np.ascontiguousarray(self.matrices[:n_period])
+        twiss_array = self.twiss_array[..., : n_period + 1]
+        psi = np.empty(twiss_array.shape[:-2] + (2, n_period + 1))
+        for twiss, psi_ in zip(
+            twiss_array.reshape(-1, 8, n_period + 1), psi.reshape(-1, 2, n_period + 1)
+        ):
+            betatron_phase(matrices, np.ascontiguousarray(twiss), psi_)
+        if n_periods == 1:
+            return psi
+        return np.stack([_tile_phase(psi_, n_periods) for psi_ in psi])
+
+    update_betatron_phase = deprecated_update("psi")
 
     @property
     def psi_x(self) -> np.ndarray:
         """Horizontal betatron phase."""
-        if self._psi_needs_update:
-            self.update_betatron_phase()
-        return self._psi_x
+        return self.psi[..., 0, :]
 
     @property
     def psi_y(self) -> np.ndarray:
         """Vertical betatron phase."""
-        if self._psi_needs_update:
-            self.update_betatron_phase()
-        return self._psi_y
+        return self.psi[..., 1, :]
 
     @property
     def tune_x(self) -> float:
-        """Horizontal tune. Corresponds to psi_x[-1] / 2 pi. Strongly depends on the selected step size."""
-        if self._psi_needs_update:
-            self.update_betatron_phase()
-        return self._tune_x
+        """Horizontal tune. Corresponds to psi_x[-1] / 2 pi."""
+        return self.psi[..., 0, -1] / TWO_PI
 
     @property
     def tune_y(self) -> float:
-        """Vertical tune. Corresponds to psi_y[-1] / 2 pi. Strongly depends on the selected step size."""
-        if self._psi_needs_update:
-            self.update_betatron_phase()
-        return self._tune_y
-
-    def update_betatron_phase(self):
-        """Manually update the betatron phase psi and the tune."""
-        size = self.accumulated_array.shape[0]
-        if self._psi_x.shape[0] != size:
-            self._psi_x = np.empty(size)
-            self._psi_y = np.empty(size)
-
-        beta_x_inverse = 1 / self.beta_x
-        beta_y_inverse = 1 / self.beta_y
-        # TODO: use faster integration!
-        # TODO: question: is pos=0 weighted doubled because start/end are same point?
-        self._psi_x = cumtrapz(beta_x_inverse, self.s, initial=0)
-        self._psi_y = cumtrapz(beta_y_inverse, self.s, initial=0)
-        self._tune_x = self._psi_x[-1] / TWO_PI
-        self._tune_y = self._psi_y[-1] / TWO_PI
-        self._psi_needs_update = False
-
-    def _on_psi_changed(self):
-        self._psi_needs_update = True
-
-    @property
+        """Vertical tune. Corresponds to psi_y[-1] / 2 pi."""
+        return self.psi[..., 1, -1] / TWO_PI
+
+    @property
+    def _integration_range(self):
+        """Indices of the points and the slices the integrals are evaluated on.
+        If the lattice is periodic, this is one period plus the next point."""
+        n_periods = self.n_periods
+        if n_periods == 1:
+            return slice(1, None), slice(None)
+        n_period = self.n_steps // n_periods
+        return slice(1, n_period + 2), slice(0, n_period + 1)
+
+    def _trapz(self, values) -> float:
+        """Integrate values at the points of :attr:`_integration_range` over s.
+        For a periodic lattice the integral of one period is scaled by the number of
+        periods."""
+        points, _ = self._integration_range
+        s = self.s[points]
+        n_periods = self.n_periods
+        if n_periods == 1:
+            return trapz(values, s)
+
+        # remove the interval between the last point and the point after the lattice
+        last = 0.5 * (values[-2] + values[-1]) * (s[-1] - s[-2])
+        return n_periods * trapz(values, s) - last
+
+    @cached_property("one_turn_matrix")
     def tune_x_fractional(self) -> float:
         """Fractional part of the horizontal tune (Calculated from one-turn matrix)."""
-        if self._tune_fractional_needs_update:
-            self.update_fractional_tune()
-        return self._tune_x_fractional
+        m = self.one_turn_matrix
+        return np.arccos((m[0, 0] + m[1, 1]) / 2) / TWO_PI
 
-    @property
+    @cached_property("one_turn_matrix")
     def tune_y_fractional(self) -> float:
         """Fractional part of the vertical tune (Calculated from one-turn matrix)."""
-        if self._tune_fractional_needs_update:
-            self.update_fractional_tune()
-        return self._tune_y_fractional
-
-    def update_fractional_tune(self):
-        """Manually update the fractional tune."""
         m = self.one_turn_matrix
-        self._tune_x_fractional = np.arccos((m[0, 0] + m[1, 1]) / 2) / TWO_PI
-        self._tune_y_fractional = np.arccos((m[2, 2] + m[3, 3]) / 2) / TWO_PI
-        self._tune_fractional_needs_update = False
+        return np.arccos((m[2, 2] + m[3, 3]) / 2) / TWO_PI
 
-    def _on_tune_fractional_changed(self):
-        self._tune_fractional_needs_update = True
+    update_fractional_tune = deprecated_update("tune_x_fractional", "tune_y_fractional")
 
-    @property
+    @cached_property("twiss_array", "matrices")
     def chromaticity_x(self) -> float:
         """Natural Horizontal Chromaticity. Depends on `n_kicks`"""
-        if self._chromaticity_needs_update:
-            self.update_chromaticity()
-        return self._chromaticity_x
+        points, slices = self._integration_range
+        k1 = self.k1[slices]
+        return -0.25 / np.pi * self._trapz(k1 * self.beta_x[..., points])
 
-    @property
+    @cached_property("twiss_array", "matrices")
     def chromaticity_y(self) -> float:
         """Natural Vertical Chromaticity. Depends on `n_kicks`"""
-        if self._chromaticity_needs_update:
-            self.update_chromaticity()
-        return self._chromaticity_y
-
-    def update_chromaticity(self):
-        """Manually update the natural chromaticity."""
-        const = 0.25 / np.pi
-        self._chromaticity_x = -const * trapz(self.k1 * self.beta_x[1:], self.s[1:])
-        self._chromaticity_y = +const * trapz(self.k1 * self.beta_y[1:], self.s[1:])
+        points, slices = self._integration_range
+        k1 = self.k1[slices]
+        return 0.25 / np.pi * self._trapz(k1 * self.beta_y[..., points])
 
-    def _on_chromaticity_changed(self):
-        self._chromaticity_needs_update = True
+    update_chromaticity = deprecated_update("chromaticity_x", "chromaticity_y")
 
-    @property
+    @cached_property("twiss_array")
     def curly_h(self) -> float:
         """The curly H function."""
-        if self._curly_h_needs_update:
-            self._curly_h = (
-                self.gamma_x * self.eta_x ** 2
-                + 2 * self.alpha_x * self.eta_x * self.eta_x_dds
-                + self.beta_x * self.eta_x_dds ** 2
-            )
-        return self._curly_h
-
-    def _on_curly_h_changed(self):
-        self._curly_h_needs_update = True
+        return (
+            self.gamma_x * self.eta_x ** 2
+            + 2 * self.alpha_x * self.eta_x * self.eta_x_dds
+            + self.beta_x * self.eta_x_dds ** 2
+        )
 
-    @property
+    @cached_property("twiss_array", "matrices")
+    def dipole_integrals(self) -> np.ndarray:
+        """Closed-form contributions of each dipole occurrence to the synchrotron
+        radiation integrals I1 - I5. (5, n_dipoles)"""
+        table = self.lattice.table
+        # dipoles without bending angle (or steps) do not contribute
+        dipoles = (table.type == TYPE_CODES[Dipole]) & (table.angle != 0)
+        dipoles &= (table.length != 0) & (self.sequence_steps > 0)
+        angle, length = table.angle[dipoles], table.length[dipoles]
+        e1, e2 = table.e1[dipoles], table.e2[dipoles]
+        twiss = self.twiss_array[..., self.sequence_starts[dipoles]]
+        return dipole_radiation_integrals(angle, length, e1, e2, twiss)
+
+    @cached_property("twiss_array", "matrices")
     def i1(self) -> float:
         """The first synchrotron radiation integral."""
-        if self._i1_needs_update:
-            self._i1 = trapz(self.k0 * self.eta_x[1:], self.s[1:])
-        return self._i1
-
-    def _on_i1_changed(self):
-        self._i1_needs_update = True
+        if self.radiation_integrals == "analytic":
+            return self.dipole_integrals[..., 0, :].sum(axis=-1)
+        points, slices = self._integration_range
+        return self._trapz(self.k0[slices] * self.eta_x[..., points])
 
-    @property
+    @cached_property("matrices")
     def i2(self) -> float:
         """The second synchrotron radiation integral."""
-        if self._i2_needs_update:
-            self._i2 = trapz(self.k0 ** 2, self.s[1:])
-        return self._i2
-
-    def _on_i2_changed(self):
-        self._i2_needs_update = True
+        if self.radiation_integrals == "analytic":
+            return self.dipole_integrals[..., 1, :].sum(axis=-1)
+        _, slices = self._integration_range
+        return self._trapz(self.k0[slices] ** 2)
 
-    @property
+    @cached_property("matrices")
     def i3(self) -> float:
         """The third synchrotron radiation integral."""
-        if self._i3_needs_update:
-            self._i3 = trapz(np.abs(self.k0 ** 3), self.s[1:])
-        return self._i3
+        if self.radiation_integrals == "analytic":
+            return self.dipole_integrals[..., 2, :].sum(axis=-1)
+        _, slices = self._integration_range
+        return self._trapz(np.abs(self.k0[slices] ** 3))
 
-    def _on_i3_changed(self):
-        self._i3_needs_update = True
-
-    @property  # TODO: Improve performance for I4
+    @cached_property("twiss_array", "matrices")  # TODO: Improve performance for I4
     def i4(self) -> float:
         """The fourth synchrotron radiation integral."""
-        if self._i4_needs_update:
-            p_effect = 0  # poleface effect (see MAD-X source code or SLAC-Pub-1193)
-            eta_x = self.eta_x
-            for element in self.lattice.elements:  # TODO: test for performance
-                if isinstance(element, Dipole):
-                    pos = self.element_indices[element]
-                    n_kicks = self.get_steps(element)
-                    e1, e2 = element.e1, element.e2
-                    tmp = np.tan(e1) * np.sum(eta_x[pos[::n_kicks]])
-                    tmp += np.tan(e2) * np.sum(  # TODO: is it correct to add + 1 here?
-                        eta_x[np.array(pos[n_kicks - 1 :: n_kicks]) + 1]
-                    )
-                    p_effect = element.k0 ** 2 * tmp
-            self._i4 = (
-                trapz(eta_x[1:] * self.k0 * (self.k0 ** 2 + 2 * self.k1), self.s[1:])
-                - p_effect
-            )
-        return self._i4
-
-    def _on_i4_changed(self):
-        self._i4_needs_update = True
-
-    @property
+        if self.radiation_integrals == "analytic":
+            return self.dipole_integrals[..., 3, :].sum(axis=-1)
+        eta_x = self.eta_x
+        p_effect = poleface_effect(self, eta_x)
+        points, slices = self._integration_range
+        k0, k1 = self.k0[slices], self.k1[slices]
+        i4 = self._trapz(eta_x[..., points] * k0 * (k0 ** 2 + 2 * k1))
+        return i4 - p_effect
+
+    @cached_property("curly_h", "matrices")
     def i5(self) -> float:
         """The fifth synchrotron radiation integral."""
-        if self._i5_needs_update:
-            self._i5 = trapz(self.curly_h[1:] * np.abs(self.k0 ** 3), self.s[1:])
-        return self._i5
-
-    def _on_i5_changed(self):
-        self._i5_needs_update = True
+        if self.radiation_integrals == "analytic":
+            return self.dipole_integrals[..., 4, :].sum(axis=-1)
+        points, slices = self._integration_range
+        k0 = self.k0[slices]
+        return self._trapz(self.curly_h[..., points] * np.abs(k0 ** 3))
 
-    @property
+    @cached_property("i1", "lattice.length")
     def alpha_c(self) -> float:
         """Momentum Compaction Factor. Depends on `n_kicks`"""
-        if self._alpha_c_needs_update:
-            self._alpha_c = self.i1 / self.lattice.length
-        return self._alpha_c
-
-    def _on_alpha_c_changed(self):
-        self._alpha_c_needs_update = True
+        return self.i1 / self.lattice.length
 
     @property
     def gamma(self) -> float:
         return self.energy * CONST_MEV_TO_GAMMA
 
-    @property
+    @cached_property("i2", "i4", "i5")
     def emittance_x(self) -> float:
-        if self._emittance_needs_update:
-            self._emittance = CONST_Q * self.gamma ** 2 * self.i5 / (self.i2 - self.i4)
-        return self._emittance
+        return CONST_Q * self.gamma ** 2 * self.i5 / (self.i2 - self.i4)
+
+
+def _tile_phase(psi, n_periods) -> np.ndarray:
+    """Repeat the phase advance psi of one period n_periods times."""
+    if n_periods == 1:
+        return psi
 
-    def _on_emittance_changed(self):
-        self._emittance_needs_update = True
+    n = psi.size - 1
+    tiled = np.empty(n_periods * n + 1)
+    offsets = psi[-1] * np.arange(n_periods)
+    tiled[:-1].reshape(n_periods, n)[:] = psi[:-1] + offsets[:, np.newaxis]
+    tiled[-1] = n_periods * psi[-1]
+    return tiled
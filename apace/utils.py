@@ -1,4 +1,10 @@
+import warnings
 from enum import Enum, auto
+from functools import partial
+from operator import attrgetter
+from types import MethodType
+from weakref import ref, WeakMethod
+from typing import Dict, Tuple
 
 
 class Signal:
@@ -6,20 +12,27 @@ class Signal:
 
     When ever the signal is emitted all registered functions are called.
 
+    Bound methods and signals are only weakly referenced, so that connecting them
+    does not keep their objects alive. They are disconnected automatically when
+    their objects get garbage collected. Other callables (e.g. functions) are
+    referenced strongly.
+
     :param signals: Signals which this signal gets registered to.
     :type signals: Signal, optional
     """
 
     def __init__(self, *signals):
         self.callbacks = set()
-        """Functions called when the signal is emitted."""
+        """References to the functions called when the signal is emitted."""
         for signal in signals:
             signal.connect(self)
 
     def __call__(self, *args, **kwargs):
         """Emit signal and call registered functions."""
-        for callback in self.callbacks:
-            callback(*args, **kwargs)
+        for reference in list(self.callbacks):
+            callback = reference()
+            if callback is not None:
+                callback(*args, **kwargs)
 
     def __str__(self):
         return "Signal"
@@ -31,7 +44,145 @@ class Signal:
 
         :param function callback: Function which gets called when the signal is emitted.
         """
-        self.callbacks.add(callback)
+        if isinstance(callback, MethodType):
+            reference = WeakMethod(callback, self.callbacks.discard)
+        elif isinstance(callback, Signal):
+            reference = ref(callback, self.callbacks.discard)
+        else:
+            reference = _StrongReference(callback)
+        self.callbacks.add(reference)
+
+
+class _StrongReference:
+    """Same interface as a weak reference, but keeps the object alive."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __call__(self):
+        return self.obj
+
+    def __hash__(self):
+        return hash(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _StrongReference) and self.obj == other.obj
+
+
+class CachedProperty:
+    """Property whose value is calculated on the first access and cached until one of
+    its dependencies changes (see :func:`cached_property`).
+
+    :param function function: Function which calculates the value.
+    :param dependencies: Names of the dependencies.
+    :type dependencies: Tuple[str]
+    """
+
+    def __init__(self, function, dependencies):
+        self.function = function
+        self.dependencies = dependencies
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        cache = obj._cache
+        try:
+            return cache[self.name]
+        except KeyError:
+            value = cache[self.name] = self.function(obj)
+            return value
+
+
+def cached_property(*dependencies):
+    """Decorator for properties, whose value is cached until one of their dependencies
+    changes. The dependencies are the names of other cached properties or of signals
+    without the `_changed` suffix, e.g. "matrices" for `matrices_changed` or
+    "lattice.length" for `lattice.length_changed`.
+
+    For each cached property `name` :func:`connect_dependencies` creates the signal
+    `name_changed`, which discards the cached value and gets emitted when one of the
+    dependencies changes.
+
+    :param dependencies: Names of the dependencies.
+    :type dependencies: str
+    """
+    return partial(CachedProperty, dependencies=dependencies)
+
+
+def dependency_graph(cls) -> Dict[str, Tuple[str, ...]]:
+    """The dependencies of all cached properties defined on the class itself.
+
+    :param type cls: The class.
+    """
+    return {
+        name: attribute.dependencies
+        for name, attribute in vars(cls).items()
+        if isinstance(attribute, CachedProperty)
+    }
+
+
+def connect_dependencies(obj, cls):
+    """Create the `name_changed` signals of the cached properties of cls for the
+    instance obj and connect them to the signals of their dependencies. Must be
+    called in the `__init__` method of cls after the signals, which are not created
+    for cached properties, exist.
+
+    :param obj: Instance of cls.
+    :param type cls: Class whose cached properties are connected.
+    """
+    obj.__dict__.setdefault("_cache", {})
+    graph = dependency_graph(cls)
+    pending = set()
+    for name in graph:
+        _connect(obj, name, graph, pending)
+
+
+def _connect(obj, name, graph, pending) -> Signal:
+    signal_name = f"{name}_changed"
+    if name not in graph or signal_name in obj.__dict__:
+        return attrgetter(signal_name)(obj)
+    if name in pending:
+        raise ValueError(f"Cyclic dependency of the cached property {name}!")
+
+    pending.add(name)
+    dependencies = [_connect(obj, other, graph, pending) for other in graph[name]]
+    signal = Signal(*dependencies)
+    signal.connect(partial(_discard, obj._cache, name))
+    setattr(obj, signal_name, signal)
+    return signal
+
+
+def deprecated_update(*names):
+    """Create a replacement for the former `update_*` methods, which recalculates
+    the cached properties `names` and emits a :class:`DeprecationWarning`.
+
+    :param str names: Names of the cached properties.
+    """
+
+    def update(self):
+        warnings.warn(
+            f"The update methods are deprecated, {', '.join(names)} is updated "
+            "automatically when accessed.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        for name in names:
+            self._cache.pop(name, None)
+            getattr(self, name)
+
+    update.__doc__ = f"Deprecated: Manually recalculate {', '.join(names)}."
+    return update
+
+
+def _discard(cache, name, *args, **kwargs):
+    cache.pop(name, None)
 
 
 class Flag:
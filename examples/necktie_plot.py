@@ -29,13 +29,7 @@ k1_end = 2
 
 q1_values = np.linspace(k1_start, k1_end, n_steps)
 q2_values = np.linspace(k1_start, -k1_end, n_steps)
-stable = np.empty((n_steps, n_steps), dtype=bool)
-
-twiss = ap.Twiss(fodo_ring)
-
-for i, q1.k1 in enumerate(q1_values):
-    for j, q2.k1 in enumerate(q2_values):
-        stable[i, j] = twiss.stable
+stable = ap.stability_map(fodo_ring, {q1: q1_values, q2: q2_values}).stable
 
 #%%
 # Plot results using matplotlib
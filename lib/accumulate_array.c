@@ -1,21 +1,115 @@
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+#include <omp.h>
+
 #define DEBUG 0
 
 #if DEBUG
 #include <stdio.h>
 #endif
 
-// perform accumulated matrix product on array of matrices
-void matrix_product_accumulated(
-    int n,
-    int start_idx,
-    double (*matrices)[6][6],
-    double (*accumulated)[6][6]
+typedef void (*product_kernel)(double (*a)[6], double (*b)[6], double (*out)[6]);
+
+// out = a * b (out must not alias a or b)
+static inline void matrix_product(double (*a)[6], double (*b)[6], double (*out)[6]) {
+    for (int i = 0; i < 6; i++) {
+        for (int j = 0; j < 6; j++) {
+            out[i][j] = 0.0;
+            for (int k = 0; k < 6; k++) {
+                out[i][j] += a[i][k] * b[k][j];
+            }
+        }
+    }
+}
+
+// out = a * b for uncoupled linear transfer matrices, which only have a 2x2 x block,
+// a 2x2 y block, the dispersion column 5, the path length row 4 and a unit diagonal
+// for the longitudinal plane (out must not alias a or b)
+static inline void matrix_product_uncoupled(
+    double (*a)[6],
+    double (*b)[6],
+    double (*out)[6]
 ) {
+    for (int i = 0; i < 2; i++) {
+        for (int j = 0; j < 2; j++) {
+            out[i][j] = a[i][0] * b[0][j] + a[i][1] * b[1][j];
+            out[i + 2][j + 2] = a[i + 2][2] * b[2][j + 2] + a[i + 2][3] * b[3][j + 2];
+            out[i][j + 2] = out[i + 2][j] = 0.0;
+        }
+        out[i][4] = out[i + 2][4] = out[i + 2][5] = 0.0;
+        out[i][5] = a[i][0] * b[0][5] + a[i][1] * b[1][5] + a[i][5];
+        out[4][i] = a[4][0] * b[0][i] + a[4][1] * b[1][i] + b[4][i];
+        out[4][i + 2] = out[5][i] = out[5][i + 2] = 0.0;
+    }
+    out[4][4] = out[5][5] = 1.0;
+    out[5][4] = 0.0;
+    out[4][5] = a[4][0] * b[0][5] + a[4][1] * b[1][5] + b[4][5] + a[4][5];
+}
+
+static inline void matrix_copy(double (*a)[6], double (*out)[6]) {
+    for (int i = 0; i < 6; i++) {
+        for (int j = 0; j < 6; j++) {
+            out[i][j] = a[i][j];
+        }
+    }
+}
+
+// load matrix pos from an array in the structure-of-arrays layout, where the entry
+// (i, j) of matrix pos is stored at soa[(6 * i + j) * stride + pos]
+static inline void matrix_load_soa(double *soa, int stride, int pos, double (*out)[6]) {
+    for (int i = 0; i < 6; i++) {
+        for (int j = 0; j < 6; j++) {
+            out[i][j] = soa[(6 * i + j) * stride + pos];
+        }
+    }
+}
+
+static inline void matrix_store_soa(double (*a)[6], double *soa, int stride, int pos) {
     for (int i = 0; i < 6; i++) {
         for (int j = 0; j < 6; j++) {
-            accumulated[start_idx][i][j] = matrices[start_idx][i][j];
+            soa[(6 * i + j) * stride + pos] = a[i][j];
+        }
+    }
+}
+
+static inline void accumulate_soa(
+    int n,
+    int stride,
+    int start_idx,
+    double *matrices,
+    double *accumulated,
+    product_kernel product
+) {
+    double matrix[6][6], previous[6][6], current[6][6];
+    matrix_load_soa(matrices, stride, start_idx, previous);
+    matrix_store_soa(previous, accumulated, n, start_idx);
+
+    for (int pos = start_idx + 1;; pos++) {
+        if (pos >= n) {
+            pos = 0;
         }
+
+        if (pos == start_idx) {
+            break;
+        }
+
+        matrix_load_soa(matrices, stride, pos, matrix);
+        product(matrix, previous, current);
+        matrix_store_soa(current, accumulated, n, pos);
+        matrix_copy(current, previous);
     }
+}
+
+static inline void accumulate_serial(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6],
+    product_kernel product
+) {
+    matrix_copy(matrices[start_idx], accumulated[start_idx]);
 
     for (int pos = start_idx + 1, pos_1 = start_idx;; pos++) {
         if (pos >= n) {
@@ -26,54 +120,384 @@ void matrix_product_accumulated(
             break;
         }
 
-        for (int i = 0; i < 6; i++) {
-            for (int j = 0; j < 6; j++) {
-                accumulated[pos][i][j] = 0.0;
-                for (int k = 0; k < 6; k++) {
-                    accumulated[pos][i][j] += matrices[pos][i][k] * accumulated[pos_1][k][j];
-                }
+        product(matrices[pos], accumulated[pos_1], accumulated[pos]);
+        pos_1 = pos;
+    }
+}
+
+// blocked parallel scan: each thread accumulates its chunk locally, the chunk
+// products are combined serially and a fix-up pass multiplies the carry of all
+// previous chunks
+static inline void accumulate_parallel(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6],
+    product_kernel product
+) {
+    int n_threads = omp_get_max_threads();
+    if (n_threads > n) {
+        n_threads = n;
+    }
+
+    double (*carry)[6][6] = malloc(n_threads * sizeof(*carry));
+    if (carry == NULL) {
+        accumulate_serial(n, start_idx, matrices, accumulated, product);
+        return;
+    }
+
+#pragma omp parallel num_threads(n_threads) shared(carry, matrices, accumulated)
+    {
+    int thread_id = omp_get_thread_num();
+    int n_chunks = omp_get_num_threads();
+    // chunk boundaries in units of steps after start_idx
+    int begin = (int) ((long) n * thread_id / n_chunks);
+    int end = (int) ((long) n * (thread_id + 1) / n_chunks);
+
+    int pos_1 = (start_idx + begin) % n;
+    matrix_copy(matrices[pos_1], accumulated[pos_1]);
+    for (int i = begin + 1; i < end; i++) {
+        int pos = (start_idx + i) % n;
+        product(matrices[pos], accumulated[pos_1], accumulated[pos]);
+        pos_1 = pos;
+    }
+
+#pragma omp barrier
+#pragma omp single
+    {
+    // carry[t] is the product of all matrices up to the end of chunk t
+    for (int t = 0; t < n_chunks; t++) {
+        int last = (start_idx + (int) ((long) n * (t + 1) / n_chunks) - 1) % n;
+        if (t == 0) {
+            matrix_copy(accumulated[last], carry[0]);
+        } else {
+            product(accumulated[last], carry[t - 1], carry[t]);
+        }
+    }
+    }
+
+    if (thread_id > 0) {
+        double tmp[6][6];
+        for (int i = begin; i < end; i++) {
+            int pos = (start_idx + i) % n;
+            product(accumulated[pos], carry[thread_id - 1], tmp);
+            matrix_copy(tmp, accumulated[pos]);
+        }
+    }
+    }
+
+    free(carry);
+}
+
+// Twiss product of a single point (see twiss_product_serial)
+static inline void twiss_point(
+    double (*m)[6],
+    double *B0,
+    int n,
+    double (*twiss)[n],
+    int pos
+) {
+    twiss[0][pos] = m[0][0] * m[0][0] * B0[0] - 2. * m[0][0] * m[0][1] * B0[2]
+                  + m[0][1] * m[0][1] * B0[4];
+    twiss[1][pos] = m[2][2] * m[2][2] * B0[1] - 2. * m[2][2] * m[2][3] * B0[3]
+                  + m[2][3] * m[2][3] * B0[5];
+    twiss[2][pos] = -m[0][0] * m[1][0] * B0[0] + m[0][0] * m[1][1] * B0[2]
+                  + m[0][1] * m[1][0] * B0[2] - m[1][1] * m[0][1] * B0[4];
+    twiss[3][pos] = -m[2][2] * m[3][2] * B0[1] + m[2][2] * m[3][3] * B0[3]
+                  + m[2][3] * m[3][2] * B0[3] - m[3][3] * m[2][3] * B0[5];
+    twiss[4][pos] = m[1][0] * m[1][0] * B0[0] - 2. * m[1][1] * m[1][0] * B0[2]
+                  + m[1][1] * m[1][1] * B0[4];
+    twiss[5][pos] = m[3][2] * m[3][2] * B0[1] - 2. * m[3][3] * m[3][2] * B0[3]
+                  + m[3][3] * m[3][3] * B0[5];
+    twiss[6][pos] = m[0][0] * B0[6] + m[0][1] * B0[7] + m[0][5];
+    twiss[7][pos] = m[1][0] * B0[6] + m[1][1] * B0[7] + m[1][5];
+}
+
+// accumulate the matrices starting at from_idx and feed the running product directly
+// into the Twiss product without storing the accumulated matrices
+static inline void twiss_streaming(
+    int n,
+    int from_idx,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double *B0,
+    double (*twiss)[n], // shape (8, n)
+    product_kernel product
+) {
+    double accumulated[6][6], tmp[6][6];
+    matrix_copy(matrices[from_idx], accumulated);
+    for (int i = 0;; i++) {
+        int pos = (from_idx + i) % (n - 1);
+        if (i > 0) {
+            product(matrices[pos], accumulated, tmp);
+            matrix_copy(tmp, accumulated);
+        }
+
+        twiss_point(accumulated, B0, n, twiss, pos + 1);
+        // the first and the last point are at the same position
+        if (pos == n - 2) {
+            twiss_point(accumulated, B0, n, twiss, 0);
+        }
+
+        if (i == n - 2) {
+            break;
+        }
+    }
+
+    for (int i = 0; i < 8; i++) {
+        twiss[i][from_idx] = B0[i];
+    }
+}
+
+// Twiss product for m initial Twiss parameter, so that each accumulated matrix is
+// only loaded once for all of them. The positions are distributed over the threads.
+void twiss_product_multiple(
+    int n,
+    int m,
+    int from_idx,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double (*B0)[8], // shape (m, 8)
+    double *twiss // shape (m, 8, n)
+) {
+    #pragma omp parallel for schedule(static)
+    for (int pos = 1; pos < n; pos++) {
+        for (int k = 0; k < m; k++) {
+            double (*twiss_k)[n] = (double (*)[n]) (twiss + (size_t) k * 8 * n);
+            twiss_point(matrices[pos - 1], B0[k], n, twiss_k, pos);
+        }
+    }
+
+    for (int k = 0; k < m; k++) {
+        double (*twiss_k)[n] = (double (*)[n]) (twiss + (size_t) k * 8 * n);
+        for (int i = 0; i < 8; i++) {
+            // the first and the last point are at the same position
+            if (from_idx != 0) {
+                twiss_k[i][0] = twiss_k[i][n - 1];
             }
+            twiss_k[i][from_idx] = B0[k][i];
         }
+    }
+}
 
-        pos_1 = pos;
+// whether x is neither infinite nor NaN. Tests the exponent bits, because the
+// kernels are compiled with -ffast-math, which lets the compiler assume that
+// floating point comparisons never see NaN or infinity
+static inline int is_finite(double x) {
+    uint64_t bits;
+    memcpy(&bits, &x, sizeof(bits));
+    return (bits & 0x7ff0000000000000ULL) != 0x7ff0000000000000ULL;
+}
+
+// initial Twiss parameter from the periodicity condition (see twiss.periodic_twiss)
+// returns 0 if there is no periodic solution
+static inline int periodic_twiss(double (*m)[6], double *B0) {
+    for (int i = 0; i < 6; i++) {
+        for (int j = 0; j < 6; j++) {
+            if (!is_finite(m[i][j])) {
+                return 0;
+            }
+        }
+    }
+
+    double term_x = 2. - m[0][0] * m[0][0] - 2. * m[0][1] * m[1][0] - m[1][1] * m[1][1];
+    double term_y = 2. - m[2][2] * m[2][2] - 2. * m[2][3] * m[3][2] - m[3][3] * m[3][3];
+    if (!is_finite(term_x) || !is_finite(term_y) || term_x <= 0. || term_y <= 0.) {
+        return 0;
     }
+
+    B0[0] = fabs(2. * m[0][1]) / sqrt(term_x);
+    B0[1] = fabs(2. * m[2][3]) / sqrt(term_y);
+    B0[2] = (m[0][0] - m[1][1]) / (2. * m[0][1]) * B0[0];
+    B0[3] = (m[2][2] - m[3][3]) / (2. * m[2][3]) * B0[1];
+    B0[4] = (1. + B0[2] * B0[2]) / B0[0];
+    B0[5] = (1. + B0[3] * B0[3]) / B0[1];
+    B0[6] = (m[0][5] * (1. - m[1][1]) + m[0][1] * m[1][5]) / (2. - m[0][0] - m[1][1]);
+    B0[7] = (m[1][5] * (1. - m[0][0]) + m[1][0] * m[0][5]) / (2. - m[0][0] - m[1][1]);
+    return 1;
 }
 
-// perform matrix product on array of matrices for given ranges
-void matrix_product_ranges(
+// periodic Twiss parameter of many variants of a lattice, the variants are
+// distributed over the threads. Whether a variant has a periodic solution is
+// stored in stable, the Twiss parameter of unstable variants are left unchanged.
+static inline void twiss_batch(
+    int n_variants,
+    int n,
+    double (*matrices)[6][6], // shape (n_variants, n - 1, 6, 6)
+    double *twiss, // shape (n_variants, 8, n)
+    int8_t *stable, // shape (n_variants)
+    product_kernel product
+) {
+    #pragma omp parallel for schedule(dynamic)
+    for (int v = 0; v < n_variants; v++) {
+        double (*variant_matrices)[6][6] = matrices + (size_t) v * (n - 1);
+        double (*variant_twiss)[n] = (double (*)[n]) (twiss + (size_t) v * 8 * n);
+
+        double one_turn[6][6], tmp[6][6], B0[8];
+        matrix_copy(variant_matrices[0], one_turn);
+        for (int pos = 1; pos < n - 1; pos++) {
+            product(variant_matrices[pos], one_turn, tmp);
+            matrix_copy(tmp, one_turn);
+        }
+
+        stable[v] = (int8_t) periodic_twiss(one_turn, B0);
+        if (stable[v]) {
+            twiss_streaming(n, 0, variant_matrices, B0, variant_twiss, product);
+        }
+    }
+}
+
+static inline void ranges_product(
     int n_ranges,
     int n_matrices,
     int (*ranges)[2],
     double (*matrices)[6][6],
-    double (*accumulated)[6][6]
+    double (*accumulated)[6][6],
+    product_kernel product
 ) {
     for (int l = 0; l < n_ranges; l++) {
         int start = ranges[l][0];
         int end = ranges[l][1];
 
-        for (int i = 0; i < 6; i++) {
-            for (int j = 0; j < 6; j++) {
-                accumulated[l][i][j] = matrices[start][i][j];
-            }
-        }
+        matrix_copy(matrices[start], accumulated[l]);
 
         int n_steps = end > start ? end - start : end - start + n_matrices;
         for (int _m = 1 ; _m < n_steps ; _m++) {
             int m = (start + _m) % n_matrices;
-            double tmp[6][6] = {{0}};
-            for (int i = 0; i < 6; i++) {
-                for (int j = 0; j < 6; j++) {
-                    for (int k = 0; k < 6; k++) {
-                        tmp[i][j] += matrices[m][i][k] * accumulated[l][k][j];
-                    }
-                }
-            }
-
-            for (int i = 0; i < 6; i++) {
-                for (int j = 0; j < 6; j++) {
-                    accumulated[l][i][j] = tmp[i][j];
-                }
-            }
+            double tmp[6][6];
+            product(matrices[m], accumulated[l], tmp);
+            matrix_copy(tmp, accumulated[l]);
         }
     }
 }
+
+// perform accumulated matrix product on array of matrices
+void matrix_product_accumulated(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    accumulate_serial(n, start_idx, matrices, accumulated, matrix_product);
+}
+
+// same as matrix_product_accumulated but only for uncoupled matrices
+void matrix_product_accumulated_uncoupled(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    accumulate_serial(n, start_idx, matrices, accumulated, matrix_product_uncoupled);
+}
+
+// perform accumulated matrix product on array of matrices using a parallel scan
+void matrix_product_accumulated_parallel(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    accumulate_parallel(n, start_idx, matrices, accumulated, matrix_product);
+}
+
+// same as matrix_product_accumulated_parallel but only for uncoupled matrices
+void matrix_product_accumulated_parallel_uncoupled(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    accumulate_parallel(n, start_idx, matrices, accumulated, matrix_product_uncoupled);
+}
+
+// perform accumulated matrix product on the first n matrices of an array in the
+// structure-of-arrays layout with shape (6, 6, stride) into an array of shape (6, 6, n)
+void matrix_product_accumulated_soa(
+    int n,
+    int stride,
+    int start_idx,
+    double *matrices,
+    double *accumulated
+) {
+    accumulate_soa(n, stride, start_idx, matrices, accumulated, matrix_product);
+}
+
+// same as matrix_product_accumulated_soa but only for uncoupled matrices
+void matrix_product_accumulated_soa_uncoupled(
+    int n,
+    int stride,
+    int start_idx,
+    double *matrices,
+    double *accumulated
+) {
+    accumulate_soa(
+        n, stride, start_idx, matrices, accumulated, matrix_product_uncoupled
+    );
+}
+
+// perform matrix product on array of matrices for given ranges
+void matrix_product_ranges(
+    int n_ranges,
+    int n_matrices,
+    int (*ranges)[2],
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    ranges_product(n_ranges, n_matrices, ranges, matrices, accumulated, matrix_product);
+}
+
+// same as matrix_product_ranges but only for uncoupled matrices
+void matrix_product_ranges_uncoupled(
+    int n_ranges,
+    int n_matrices,
+    int (*ranges)[2],
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+) {
+    ranges_product(
+        n_ranges, n_matrices, ranges, matrices, accumulated, matrix_product_uncoupled
+    );
+}
+
+// Twiss product without materializing the accumulated transfer matrices
+void twiss_product_streaming(
+    int n,
+    int from_idx,
+    double (*matrices)[6][6],
+    double *B0,
+    double (*twiss)[n]
+) {
+    twiss_streaming(n, from_idx, matrices, B0, twiss, matrix_product);
+}
+
+// same as twiss_product_streaming but only for uncoupled matrices
+void twiss_product_streaming_uncoupled(
+    int n,
+    int from_idx,
+    double (*matrices)[6][6],
+    double *B0,
+    double (*twiss)[n]
+) {
+    twiss_streaming(n, from_idx, matrices, B0, twiss, matrix_product_uncoupled);
+}
+
+// periodic Twiss parameter of many variants of a lattice
+void twiss_product_batch(
+    int n_variants,
+    int n,
+    double (*matrices)[6][6],
+    double *twiss,
+    int8_t *stable
+) {
+    twiss_batch(n_variants, n, matrices, twiss, stable, matrix_product);
+}
+
+// same as twiss_product_batch but only for uncoupled matrices
+void twiss_product_batch_uncoupled(
+    int n_variants,
+    int n,
+    double (*matrices)[6][6],
+    double *twiss,
+    int8_t *stable
+) {
+    twiss_batch(n_variants, n, matrices, twiss, stable, matrix_product_uncoupled);
+}
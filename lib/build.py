@@ -17,6 +17,7 @@ ffi_builder.set_source(
         "-ffast-math",
     ],
     extra_link_args=["-fopenmp"],
+    libraries=["m"],
 )
 
 header = """\
@@ -28,6 +29,13 @@ void twiss_product_serial (
     double (*twiss)[] // shape (8, n)
 );
 
+void betatron_phase (
+    int n,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double (*twiss)[], // shape (8, n)
+    double (*psi)[] // shape (2, n)
+);
+
 void twiss_product_parallel (
     int n,
     int from_idx,
@@ -36,6 +44,55 @@ void twiss_product_parallel (
     double (*twiss)[] // shape (8, n)
 );
 
+void twiss_product_soa (
+    int n,
+    int from_idx,
+    double *matrices, // shape (6, 6, n - 1)
+    double *B0,
+    double (*twiss)[] // shape (8, n)
+);
+
+void twiss_product_streaming(
+    int n,
+    int from_idx,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double *B0,
+    double (*twiss)[] // shape (8, n)
+);
+
+void twiss_product_streaming_uncoupled(
+    int n,
+    int from_idx,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double *B0,
+    double (*twiss)[] // shape (8, n)
+);
+
+void twiss_product_multiple(
+    int n,
+    int m,
+    int from_idx,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6)
+    double (*B0)[8], // shape (m, 8)
+    double *twiss // shape (m, 8, n)
+);
+
+void twiss_product_batch(
+    int n_variants,
+    int n,
+    double (*matrices)[6][6], // shape (n_variants, n - 1, 6, 6)
+    double *twiss, // shape (n_variants, 8, n)
+    int8_t *stable // shape (n_variants)
+);
+
+void twiss_product_batch_uncoupled(
+    int n_variants,
+    int n,
+    double (*matrices)[6][6], // shape (n_variants, n - 1, 6, 6)
+    double *twiss, // shape (n_variants, 8, n)
+    int8_t *stable // shape (n_variants)
+);
+
 void matrix_product_accumulated(
     int n,
     int start_idx,
@@ -43,6 +100,43 @@ void matrix_product_accumulated(
     double (*accumulated)[6][6]
 );
 
+void matrix_product_accumulated_uncoupled(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+);
+
+void matrix_product_accumulated_parallel(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+);
+
+void matrix_product_accumulated_parallel_uncoupled(
+    int n,
+    int start_idx,
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+);
+
+void matrix_product_accumulated_soa(
+    int n,
+    int stride,
+    int start_idx,
+    double *matrices,
+    double *accumulated
+);
+
+void matrix_product_accumulated_soa_uncoupled(
+    int n,
+    int stride,
+    int start_idx,
+    double *matrices,
+    double *accumulated
+);
+
 void matrix_product_ranges(
     int n_ranges,
     int n_matrices,
@@ -50,6 +144,14 @@ void matrix_product_ranges(
     double (*matrices)[6][6],
     double (*accumulated)[6][6]
 );
+
+void matrix_product_ranges_uncoupled(
+    int n_ranges,
+    int n_matrices,
+    int (*ranges)[2],
+    double (*matrices)[6][6],
+    double (*accumulated)[6][6]
+);
 """
 
 ffi_builder.cdef(header)
@@ -1,3 +1,5 @@
+#include <math.h>
+
 #define DEBUG 0
 
 #if DEBUG
@@ -62,17 +64,98 @@ void twiss_product_serial (
     }
 }
 
-// TODO: Check if it is faster to write to memory continuously by transposing twiss_array
-//    for ( pos = 0; pos < n; pos ++ ) {
-//        m = A[pos];
-//        tmp[0] = m[0][0] * m[0][0] * B0[0] - 2. * m[0][0] * m[0][1] * B0[2] + m[0][1] * m[0][1] * B0[4];
-//        tmp[1] = m[2][2] * m[2][2] * B0[1] - 2. * m[2][2] * m[2][3] * B0[3] + m[2][3] * m[2][3] * B0[5];
-//
-//        tmp[2] =-m[0][0] * m[1][0] * B0[0] + (m[0][0] * m[1][1] + m[0][1] * m[1][0]) * B0[2] - m[1][1] * m[0][1] * B0[4];
-//        tmp[3] =-m[2][2] * m[3][2] * B0[1] + (m[2][2] * m[3][3] + m[2][3] * m[3][2]) * B0[3] - m[3][3] * m[2][3] * B0[5];
-//
-//        tmp[4] = m[1][0] * m[1][0] * B0[0] - 2. * m[1][1] * m[1][0] * B0[2] + m[1][1] * m[1][1] * B0[4];
-//        tmp[5] = m[3][2] * m[3][2] * B0[1] - 2. * m[3][3] * m[3][2] * B0[3] + m[3][3] * m[3][3] * B0[5];
-//        tmp[6] = m[0][0] * B0[6]  + m[0][1]* B0[7] + m[0][4];
-//        tmp[7] = m[1][0] * B0[6]  + m[1][1]* B0[7] + m[1][4];
-//    }
+// Same as twiss_product_serial but for accumulated matrices in the
+// structure-of-arrays layout with shape (6, 6, n - 1), so that the loop over the
+// positions reads and writes contiguous memory and can be vectorized
+void twiss_product_soa (
+    int n,
+    int from_idx,
+    double *matrices, // shape (6, 6, n - 1)
+    double *B0,
+    double (*twiss)[n] // shape (8, n)
+) {
+    int stride = n - 1;
+#define M(i, j) matrices[(6 * (i) + (j)) * stride + pos_1]
+
+#pragma omp simd
+    for (int pos = 1; pos < n; pos++) {
+        int pos_1 = pos - 1;
+
+        // beta_x
+        twiss[0][pos] =      M(0, 0) * M(0, 0) * B0[0]
+                      - 2. * M(0, 0) * M(0, 1) * B0[2]
+                      +      M(0, 1) * M(0, 1) * B0[4];
+
+        // beta_y
+        twiss[1][pos] =      M(2, 2) * M(2, 2) * B0[1]
+                      - 2. * M(2, 2) * M(2, 3) * B0[3]
+                      +      M(2, 3) * M(2, 3) * B0[5];
+
+        // alpha_x
+        twiss[2][pos] = -M(0, 0) * M(1, 0) * B0[0]
+                      +  M(0, 0) * M(1, 1) * B0[2]
+                      +  M(0, 1) * M(1, 0) * B0[2]
+                      -  M(1, 1) * M(0, 1) * B0[4];
+
+        // alpha_y
+        twiss[3][pos] = -M(2, 2) * M(3, 2) * B0[1]
+                      +  M(2, 2) * M(3, 3) * B0[3]
+                      +  M(2, 3) * M(3, 2) * B0[3]
+                      -  M(3, 3) * M(2, 3) * B0[5];
+
+        // gamma_x
+        twiss[4][pos] =      M(1, 0) * M(1, 0) * B0[0]
+                      - 2. * M(1, 1) * M(1, 0) * B0[2]
+                      +      M(1, 1) * M(1, 1) * B0[4];
+
+        // gamma_y
+        twiss[5][pos] =      M(3, 2) * M(3, 2) * B0[1]
+                      - 2. * M(3, 3) * M(3, 2) * B0[3]
+                      +      M(3, 3) * M(3, 3) * B0[5];
+
+        // eta_x
+        twiss[6][pos] = M(0, 0) * B0[6] + M(0, 1) * B0[7] + M(0, 5);
+
+        // eta_y
+        twiss[7][pos] = M(1, 0) * B0[6] + M(1, 1) * B0[7] + M(1, 5);
+    }
+#undef M
+
+    // the first and the last point are at the same position
+    if (from_idx != 0) {
+        for (int i = 0; i < 8; i++) {
+            twiss[i][0] = twiss[i][n - 1];
+        }
+    }
+
+    for (int i = 0; i < 8; i++) {
+        twiss[i][from_idx] = B0[i];
+    }
+}
+
+// Exact betatron phase from the transfer matrices of the steps and the Twiss
+// parameter at their entrance: tan(dpsi) = m12 / (beta * m11 - alpha * m12)
+void betatron_phase (
+    int n,
+    double (*matrices)[6][6], // shape (n - 1, 6, 6) (not accumulated)
+    double (*twiss)[n], // shape (8, n)
+    double (*psi)[n] // shape (2, n)
+) {
+    const double two_pi = 2. * M_PI;
+    for (int plane = 0; plane < 2; plane++) {
+        int i = 2 * plane;
+        double *beta = twiss[plane], *alpha = twiss[2 + plane];
+        double *psi_plane = psi[plane];
+
+        for (int pos = 0; pos < n - 1; pos++) {
+            double m11 = matrices[pos][i][i], m12 = matrices[pos][i][i + 1];
+            double dpsi = atan2(m12, beta[pos] * m11 - alpha[pos] * m12);
+            psi_plane[pos + 1] = dpsi < 0. ? dpsi + two_pi : dpsi;
+        }
+
+        psi_plane[0] = 0.;
+        for (int pos = 1; pos < n; pos++) {
+            psi_plane[pos] += psi_plane[pos - 1];
+        }
+    }
+}
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import apace as ap
+
+
+def test_stability_map(fodo_ring):
+    q1, q2 = fodo_ring["Q1"], fodo_ring["Q2"]
+    q1_values = np.linspace(0, 2, 6)
+    q2_values = np.linspace(0, -2, 5)
+    stability_map = ap.stability_map(
+        fodo_ring, {q1: q1_values, "Q2": q2_values}, n_threads=2
+    )
+    assert stability_map.shape == (6, 5)
+
+    twiss = ap.Twiss(fodo_ring)
+    for i, q1.k1 in enumerate(q1_values):
+        for j, q2.k1 in enumerate(q2_values):
+            assert np.isclose(twiss.term_x, stability_map.term_x[i, j])
+            assert np.isclose(twiss.term_y, stability_map.term_y[i, j])
+            assert twiss.stable == stability_map.stable[i, j]
+            if twiss.stable:
+                tune_x = stability_map.tune_x_fractional[i, j]
+                assert np.isclose(twiss.tune_x_fractional, tune_x)
+
+
+def test_stability_map_type_error(fodo_ring):
+    with pytest.raises(TypeError):
+        ap.stability_map(fodo_ring, {"B1": [0.1, 0.2]})
+
+
+def test_batch_twiss(fodo_ring):
+    q1, q2 = fodo_ring["Q1"], fodo_ring["Q2"]
+    values = np.array([[1.2, -1.2], [1.0, -1.4], [0.0, -0.8], [3.0, -3.0]])
+    batch = ap.batch_twiss(
+        fodo_ring, [q1, "Q2"], values, arrays=True, chunk_size=3, energy=1000
+    )
+    twiss = ap.Twiss(fodo_ring, energy=1000)
+    for i, (q1.k1, q2.k1) in enumerate(values):
+        assert twiss.stable == batch.stable[i]
+        if not twiss.stable:
+            assert np.all(np.isnan(batch.beta_x[i]))
+            continue
+
+        assert np.allclose(twiss.beta_x, batch.beta_x[i])
+        assert np.allclose(twiss.eta_x, batch.eta_x[i])
+        assert np.isclose(twiss.tune_x, batch.tune_x[i])
+        assert np.isclose(twiss.tune_y, batch.tune_y[i])
+        assert np.isclose(twiss.chromaticity_x, batch.chromaticity_x[i])
+        assert np.isclose(twiss.chromaticity_y, batch.chromaticity_y[i])
+        assert np.isclose(twiss.emittance_x, batch.emittance_x[i])
+
+    # the chunk size is derived from the memory budget (one variant per chunk here)
+    small = ap.batch_twiss(fodo_ring, [q1, q2], values, arrays=True, max_bytes=1)
+    assert np.array_equal(batch.stable, small.stable)
+    assert np.allclose(batch.beta_x[batch.stable], small.beta_x[small.stable])
@@ -1,4 +1,6 @@
+import numpy as np
 import apace as ap
+from apace.utils import Attribute
 import pytest
 
 
@@ -54,3 +56,144 @@ def test_print_tree():
     nested3 = ap.Lattice("nested3", [drift, nested2, drift])
     nested4 = ap.Lattice("nested4", 2 * [nested3])
     nested4.print_tree()
+
+
+def test_periodicity():
+    d = ap.Drift("D", length=1)
+    q = ap.Quadrupole("Q", length=1, k1=1)
+    cell = ap.Lattice("Cell", [q, d, d, q, d, d])
+    assert 2 == cell.periodicity
+    assert 8 == ap.Lattice("Ring", 4 * [cell]).periodicity
+    assert 1 == ap.Lattice("NoPeriod", [q, d, q]).periodicity
+    assert 4 == ap.Lattice("Mixed", [cell, q, d, d, q, d, d]).periodicity
+
+
+def test_cached_property():
+    class Example:
+        def __init__(self):
+            self.value_changed = ap.Signal()
+            ap.utils.connect_dependencies(self, Example)
+            self.calls = 0
+
+        @ap.utils.cached_property("value")
+        def double(self):
+            self.calls += 1
+            return 2
+
+        @ap.utils.cached_property("double")
+        def quadruple(self):
+            return 2 * self.double
+
+    example = Example()
+    assert ap.utils.dependency_graph(Example) == {
+        "double": ("value",),
+        "quadruple": ("double",),
+    }
+    assert example.quadruple == example.quadruple == 4
+    assert example.calls == 1
+    example.value_changed()
+    assert example.quadruple == 4
+    assert example.calls == 2
+
+
+def test_signal_references():
+    class Receiver:
+        def __init__(self):
+            self.calls = 0
+
+        def callback(self):
+            self.calls += 1
+
+    calls = []
+    signal = ap.Signal()
+    receiver = Receiver()
+    signal.connect(receiver.callback)
+    signal.connect(lambda: calls.append(1))
+    signal()
+    assert receiver.calls == 1 and len(calls) == 1
+
+    del receiver  # bound methods are referenced weakly
+    assert len(signal.callbacks) == 1
+    signal()
+    assert len(calls) == 2
+
+
+def test_batch_update(fodo_ring):
+    fodo_cell = fodo_ring.children[0]
+    q1, q2, d1 = fodo_ring["Q1"], fodo_ring["Q2"], fodo_ring["D1"]
+    emitted = {fodo_ring: [], fodo_cell: []}
+    for lattice, changes in emitted.items():
+        lattice.elements_changed.connect(changes.append)
+    element_changed = []
+    fodo_ring.element_changed.connect(lambda *args: element_changed.append(args))
+    length = fodo_ring.length
+
+    with fodo_ring.batch_update():
+        for _ in range(10):
+            q1.k1 += 0.1
+            q2.k1 -= 0.1
+        with fodo_cell.batch_update():
+            d1.length += 0.1
+        assert fodo_ring.length == pytest.approx(length + 8 * 4 * 0.1)
+        assert not element_changed and not emitted[fodo_ring]
+
+    expected = {q1: {Attribute.K1}, q2: {Attribute.K1}, d1: {Attribute.LENGTH}}
+    assert emitted == {fodo_ring: [expected], fodo_cell: [expected]}
+    assert not element_changed
+    assert fodo_ring.length == pytest.approx(length + 8 * 4 * 0.1)
+
+    q1.k1 += 0.1  # outside of a batch update every change is emitted
+    assert emitted[fodo_ring][-1] == {q1: {Attribute.K1}}
+    assert len(element_changed) == 1
+
+
+def test_parameters(fodo_ring):
+    fodo_cell = fodo_ring.children[0]
+    q1, b1 = fodo_ring["Q1"], fodo_ring["B1"]
+    parameters = fodo_ring.parameters(["Q1.k1", "B1.angle", "B1.length"])
+    initial = parameters.get()
+    assert list(initial) == [q1.k1, b1.angle, b1.length]
+    emitted = []
+    fodo_cell.elements_changed.connect(emitted.append)
+    length = fodo_ring.length
+
+    parameters.set(initial + [0.1, 0, 0.5])
+    assert list(parameters.get()) == [q1.k1, b1.angle, b1.length]
+    assert q1.k1 == initial[0] + 0.1 and b1.length == initial[2] + 0.5
+    assert emitted == [{q1: {Attribute.K1}, b1: {Attribute.LENGTH}}]
+    assert fodo_ring.length == pytest.approx(length + 8 * 2 * 0.5)
+
+    parameters.set(initial)
+    assert fodo_ring.length == pytest.approx(length)
+    with pytest.raises(ValueError):
+        parameters.set(initial[:2])
+    for name in ["Q3.k1", "FODO.length", "Q1.angle", "B1.radius"]:
+        with pytest.raises(ValueError):
+            fodo_ring.parameters([name])
+
+
+def test_sequence_table(fodo_ring):
+    table = fodo_ring.table
+    sequence = fodo_ring.sequence
+    assert len(table) == len(sequence)
+    assert [table.elements[i] for i in table.element] == sequence
+    codes = ap.classes.TYPE_CODES
+    assert list(table.type[:3]) == [codes[type(e)] for e in sequence[:3]]
+    assert list(table.length) == [element.length for element in sequence]
+    assert list(table.k1[:2]) == [sequence[0].k1, 0]
+    assert table.s_start[0] == 0
+    assert table.s_start[-1] + table.length[-1] == pytest.approx(fodo_ring.length)
+
+    b1, q1 = fodo_ring["B1"], fodo_ring["Q1"]
+    length = fodo_ring.length
+    with fodo_ring.batch_update():
+        b1.angle += 0.1
+        b1.length += 0.5
+        q1.k1 += 0.1
+    assert np.all(table.angle[fodo_ring.indices[b1]] == b1.angle)
+    assert np.all(table.k1[fodo_ring.indices[q1]] == q1.k1)
+    assert table.s_start[-1] + table.length[-1] == pytest.approx(length + 8)
+    b1.angle -= 0.1
+    b1.length -= 0.5
+    q1.k1 -= 0.1
+    assert np.all(table.length[fodo_ring.indices[b1]] == b1.length)
@@ -12,3 +12,70 @@ def test_angle_k1(fodo_cell):
     assert np.all(q1.k1 == matrix_method.k1[q1_indices])
     assert np.all(0 == matrix_method.k1[b1_indices])
     assert np.all(0 == matrix_method.k0[q1_indices])
+
+
+def test_dipole_edges():
+    dipole = ap.Dipole("B", length=1.5, angle=0.4, e1=0.2, e2=0.1)
+    lattice = ap.Lattice("L", [dipole])
+    matrix_method = ap.MatrixMethod(lattice, steps_per_element=3)
+    matrices = matrix_method.matrices
+    tan_r1, tan_r2 = np.tan(0.2) / dipole.radius, np.tan(0.1) / dipole.radius
+    edge_1, edge_2 = np.identity(6), np.identity(6)
+    edge_1[1, 0], edge_1[3, 2] = tan_r1, -tan_r1
+    edge_2[1, 0], edge_2[3, 2] = tan_r2, -tan_r2
+    assert np.allclose(matrices[0], np.dot(matrices[1], edge_1))
+    assert np.allclose(matrices[2], np.dot(edge_2, matrices[1]))
+
+
+def test_matrix_cache(fodo_cell):
+    cache = ap.MatrixMethod.cache
+    cache.clear()
+    ap.MatrixMethod(fodo_cell).matrices
+    assert cache.misses == len(fodo_cell.elements)
+    assert cache.hits == 0
+
+    matrix_method = ap.MatrixMethod(fodo_cell)
+    matrix_method.matrices
+    assert cache.hits == len(fodo_cell.elements)
+
+    maxsize = cache.maxsize
+    cache.maxsize = 2
+    assert len(cache) == 2
+    cache.maxsize = maxsize
+
+
+def test_uncoupled(fodo_ring):
+    matrix_method = ap.MatrixMethod(fodo_ring)
+    assert matrix_method.uncoupled
+
+    matrices = matrix_method.matrices
+    dense, sparse = np.empty(matrices.shape), np.empty(matrices.shape)
+    ap.clib.matrix_product_accumulated(matrices, dense, 3)
+    ap.clib.matrix_product_accumulated(matrices, sparse, 3, uncoupled=True)
+    assert np.allclose(dense, sparse)
+
+
+def test_product_tree():
+    rng = np.random.default_rng(0)
+    leaves = rng.normal(size=(5, 6, 6))
+    tree = ap.matrixmethod.ProductTree(leaves)
+    assert np.allclose(np.linalg.multi_dot(leaves[::-1]), tree.root)
+
+    leaves[1] = leaves[4] = rng.normal(size=(6, 6))
+    tree.update([1, 4], leaves[[1, 4]])
+    assert np.allclose(np.linalg.multi_dot(leaves[::-1]), tree.root)
+
+
+def test_transfer_matrix_update():
+    drift = ap.Drift("D", length=0.5)
+    quads = [ap.Quadrupole(f"Q{i}", length=0.2, k1=(-1) ** i) for i in range(20)]
+    lattice = ap.Lattice("L", [obj for quad in quads for obj in (quad, drift)])
+    matrix_method = ap.MatrixMethod(lattice)
+    matrix_method.transfer_matrix()
+    quads[7].k1 = 0.3
+    quads[12].k1 = -0.4
+
+    expected = np.identity(6)
+    for matrix in matrix_method.matrices:
+        expected = np.dot(matrix, expected)
+    assert np.allclose(expected, matrix_method.transfer_matrix())
@@ -1,5 +1,6 @@
 from functools import partial
 import math
+import weakref
 
 import numpy as np
 import pytest
@@ -7,6 +8,7 @@ import pytest
 import apace as ap
 
 allclose_atol = partial(np.allclose, atol=1e-3)
+TWO_PI = 2 * np.pi
 
 _twiss = None
 # Todo: test start_idx with start_idx=randrange(n_elements)
@@ -114,3 +116,352 @@ def test_element_change(twiss):
     assert beta_x_initial != twiss.beta_x[0]
     assert tune_x_initial != twiss.tune_x
     q1.k1 -= 0.25  # set back to avoid failure of other tests
+
+
+def test_batch_update_shared_lattice(fodo_cell):
+    ring_a = ap.Lattice("RING_A", 8 * [fodo_cell])
+    ring_f = ap.Lattice("RING_F", 4 * [fodo_cell])
+    twiss = ap.Twiss(ring_f)
+    beta_x, length = twiss.beta_x.copy(), ring_f.length
+    with ring_a.batch_update():
+        fodo_cell["Q1"].k1 *= 0.98
+        fodo_cell["D1"].length += 0.1
+        assert ring_f.length == pytest.approx(length + 4 * 4 * 0.1)
+
+    expected = ap.Twiss(ap.Lattice("RING", 4 * [fodo_cell])).beta_x
+    assert not np.allclose(beta_x[0], twiss.beta_x[0])
+    assert np.allclose(expected, twiss.beta_x)
+    assert ring_f.length == pytest.approx(length + 4 * 4 * 0.1)
+
+
+def test_parameters(fodo_ring):
+    twiss = ap.Twiss(fodo_ring)
+    q1, q2 = fodo_ring["Q1"], fodo_ring["Q2"]
+    parameters = fodo_ring.parameters(["Q1.k1", "Q2.k1"])
+    initial = parameters.get()
+    twiss.beta_x
+    parameters.set(initial * 1.01)
+    assert twiss.changed_elements == {q1, q2}
+    beta_x = twiss.beta_x.copy()
+
+    parameters.set(initial)
+    q1.k1, q2.k1 = initial * 1.01
+    assert np.allclose(beta_x, twiss.beta_x)
+    q1.k1, q2.k1 = initial
+
+
+def test_parameters_shared_element(fodo_cell):
+    q1 = fodo_cell["Q1"]
+    other = ap.Lattice("OTHER", [q1, ap.Drift("D", length=1)])
+    twiss = ap.Twiss(fodo_cell)
+    beta_x, k1 = twiss.beta_x.copy(), q1.k1
+
+    other.parameters(["Q1.k1"]).set([0.98 * k1])
+    assert q1.k1 == 0.98 * k1
+    assert np.all(fodo_cell.table.k1[fodo_cell.indices[q1]] == q1.k1)
+    assert not np.allclose(beta_x, twiss.beta_x)
+    assert np.allclose(ap.Twiss(fodo_cell).beta_x, twiss.beta_x)
+    q1.k1 = k1
+
+
+def test_cached_properties(fodo_cell, monkeypatch):
+    twiss = ap.Twiss(fodo_cell, energy=1000)
+    calls = []
+    function = ap.Twiss.i5.function
+    monkeypatch.setattr(
+        ap.Twiss.i5, "function", lambda obj: calls.append(1) or function(obj)
+    )
+    values = {
+        name: getattr(twiss, name)
+        for name in ("emittance_x", "alpha_c", "chromaticity_x", "tune_x_fractional")
+    }
+    for _ in range(3):
+        assert twiss.emittance_x == values["emittance_x"]
+    assert len(calls) == 1
+
+    fodo_cell["Q1"].k1 += 0.25
+    for name, value in values.items():
+        assert getattr(twiss, name) != value
+    assert len(calls) == 2
+
+
+def test_deprecated_api(fodo_cell):
+    twiss = ap.Twiss(fodo_cell)
+    emitted = []
+    twiss.tune_fractional_changed.connect(lambda: emitted.append("tune"))
+    twiss.chromaticity_changed.connect(lambda: emitted.append("chromaticity"))
+    chromaticity_x = twiss.chromaticity_x
+    fodo_cell["Q1"].k1 += 0.25
+    assert {"tune", "chromaticity"} <= set(emitted)
+    fodo_cell["Q1"].k1 -= 0.25
+
+    for name in ("update_twiss_array", "update_chromaticity", "update_n_steps"):
+        with pytest.warns(DeprecationWarning):
+            getattr(twiss, name)()
+    assert "chromaticity_x" in twiss._cache
+    assert np.isclose(twiss.chromaticity_x, chromaticity_x)
+
+
+def test_garbage_collection(fodo_cell):
+    twiss = ap.Twiss(fodo_cell)
+    twiss.beta_x
+    reference = weakref.ref(twiss)
+    n_callbacks = len(fodo_cell.elements_changed.callbacks)
+    del twiss
+    assert reference() is None
+    assert len(fodo_cell.elements_changed.callbacks) == n_callbacks - 1
+    fodo_cell["Q1"].k1 += 0.25  # must not call discarded objects
+
+
+def test_transfer_matrix(fodo_ring):
+    twiss = ap.Twiss(fodo_ring, steps_per_element=3)
+    assert np.allclose(twiss.accumulated_array[-1], twiss.one_turn_matrix)
+
+    fodo_cell = fodo_ring.children[0]
+    cell_matrix = np.identity(6)
+    for matrix in twiss.matrices[: twiss.n_steps // 8]:
+        cell_matrix = np.dot(matrix, cell_matrix)
+    assert np.allclose(cell_matrix, twiss.transfer_matrix(fodo_cell))
+
+    q1 = fodo_ring["Q1"]
+    q1.k1 += 0.1
+    assert np.allclose(twiss.accumulated_array[-1], twiss.one_turn_matrix)
+    q1.k1 -= 0.1
+
+    # lattices which are not part of the lattice (like fodo_ring) are not referenced
+    cell_twiss = ap.Twiss(fodo_cell)
+    cell_twiss.transfer_matrix()
+    q1.k1 += 0.1
+    assert set(cell_twiss._changed_children) == {fodo_cell}
+    q1.k1 -= 0.1
+
+
+def test_use_periodicity(fodo_ring):
+    twiss = ap.Twiss(fodo_ring, energy=1000, steps_per_element=5)
+    periodic = ap.Twiss(
+        fodo_ring, energy=1000, steps_per_element=5, use_periodicity=True
+    )
+    assert 8 == periodic.n_periods
+    assert periodic.accumulated_array.shape[0] == twiss.n_steps // 8
+    assert np.allclose(twiss.twiss_array, periodic.twiss_array)
+    assert np.allclose(twiss.psi_x, periodic.psi_x)
+    assert math.isclose(twiss.tune_y, periodic.tune_y)
+    assert math.isclose(twiss.i5, periodic.i5)
+    assert math.isclose(twiss.emittance_x, periodic.emittance_x)
+
+
+def test_parallel(fodo_ring, monkeypatch):
+    monkeypatch.setattr(ap.clib, "PARALLEL_THRESHOLD", 0)
+    twiss = ap.Twiss(fodo_ring, start_idx=5)
+    parallel = ap.Twiss(fodo_ring, start_idx=5, parallel=True)
+    assert np.allclose(twiss.accumulated_array, parallel.accumulated_array)
+    assert np.allclose(twiss.twiss_array, parallel.twiss_array)
+
+
+def test_soa_layout(fodo_ring):
+    twiss = ap.Twiss(fodo_ring, start_idx=13)
+    soa = ap.Twiss(fodo_ring, start_idx=13, layout="soa")
+    assert soa.matrices.shape == twiss.matrices.shape
+    assert np.array_equal(twiss.matrices, soa.matrices)
+    assert np.allclose(twiss.accumulated_array, soa.accumulated_array)
+    assert np.allclose(twiss.twiss_array, soa.twiss_array)
+
+
+@pytest.mark.parametrize("start_idx", [0, 7])
+@pytest.mark.parametrize("use_periodicity", [False, True])
+def test_streaming(fodo_ring, start_idx, use_periodicity):
+    kwargs = dict(start_idx=start_idx, use_periodicity=use_periodicity)
+    twiss = ap.Twiss(fodo_ring, **kwargs)
+    streaming = ap.Twiss(fodo_ring, streaming=True, **kwargs)
+    assert np.allclose(twiss.twiss_array, streaming.twiss_array)
+    assert np.allclose(twiss.one_turn_matrix, streaming.one_turn_matrix)
+    assert streaming._accumulated_array.size == 0
+    assert np.allclose(twiss.accumulated_array, streaming.accumulated_array)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_start_idx_change(fodo_ring, streaming):
+    twiss = ap.Twiss(fodo_ring, streaming=streaming)
+    twiss_array = twiss.twiss_array
+    emitted = []
+    twiss.start_idx_changed.connect(lambda: emitted.append(twiss.start_idx))
+    for start_idx in [13, 5, 0, 40]:
+        twiss.start_idx = start_idx
+        assert emitted[-1] == start_idx
+        reference = ap.Twiss(fodo_ring, start_idx=start_idx, streaming=streaming)
+        assert np.allclose(reference.one_turn_matrix, twiss.one_turn_matrix)
+        assert twiss.twiss_array is twiss_array
+        assert np.allclose(reference.twiss_array, twiss.twiss_array)
+        assert np.allclose(reference.accumulated_array, twiss.accumulated_array)
+
+    twiss_0 = twiss_array[:, 0].copy()
+    initial = ap.Twiss(fodo_ring, initial=twiss_0, observation_points=[5])
+    initial.observation_array
+    initial.start_idx_changed.connect(lambda: emitted.append(initial.start_idx))
+    initial.start_idx = 7
+    assert emitted[-1] == 7 and "observation_array" not in initial._cache
+
+    for start_idx in [-1, twiss.n_steps]:
+        with pytest.raises(ValueError):
+            twiss.start_idx = start_idx
+    assert twiss.start_idx == 40
+
+
+def test_multiple_initial(fodo_cell):
+    periodic = ap.Twiss(fodo_cell, energy=1000)
+    initial = np.array([periodic.twiss_array[:, 0]] * 3)
+    initial[1, 0] *= 1.1  # mismatched beta_x
+    initial[2, 6] += 0.1  # mismatched eta_x
+    twiss = ap.Twiss(fodo_cell, initial=initial, energy=1000)
+    assert twiss.twiss_array.shape == (3, 8, twiss.n_steps + 1)
+    assert twiss.tune_x.shape == (3,)
+    for i in range(3):
+        single = ap.Twiss(fodo_cell, initial=initial[i], energy=1000)
+        assert np.allclose(single.twiss_array, twiss.twiss_array[i])
+        assert np.allclose(single.psi_x, twiss.psi_x[i])
+        assert np.isclose(single.chromaticity_x, twiss.chromaticity_x[i])
+        assert np.isclose(single.emittance_x, twiss.emittance_x[i])
+
+    initial[1, 4] = (1 + initial[1, 2] ** 2) / initial[1, 0]  # consistent gamma_x
+    twiss = ap.Twiss(fodo_cell, initial=initial)
+    observed = ap.Twiss(fodo_cell, initial=initial, observation_points=["Q2", "B1"])
+    indices = observed.observation_indices
+    assert observed.observation_array.shape == (3, 8, len(indices))
+    assert np.allclose(twiss.twiss_array[..., indices], observed.observation_array)
+    assert np.allclose(twiss.psi_x[..., indices], observed.observation_psi_x)
+
+
+@pytest.mark.parametrize("start_idx", [0, 9])
+def test_observation_points(fodo_ring, start_idx):
+    reference = ap.Twiss(fodo_ring, start_idx=start_idx)
+    twiss = ap.Twiss(fodo_ring, start_idx=start_idx, observation_points=["Q2", 5])
+    indices = twiss.observation_indices
+    assert len(indices) == 9
+    assert np.allclose(reference.twiss_array[:, indices], twiss.observation_array)
+    assert twiss._twiss_array.size == 0 and twiss._accumulated_array.size == 0
+
+    # the phase advance is exact and agrees with a finely sliced lattice
+    fine = ap.Twiss(fodo_ring, steps_per_element=200)
+    s = twiss.s[indices]
+    s[s < twiss.s[start_idx]] += fodo_ring.length
+    psi_x = np.interp(s, fine.s, fine.psi_x, period=fodo_ring.length)
+    psi_x[s >= fodo_ring.length] += TWO_PI * fine.tune_x
+    psi_x -= np.interp(twiss.s[start_idx], fine.s, fine.psi_x)
+    assert np.allclose(psi_x, twiss.observation_psi_x, atol=1e-4)
+
+
+def test_exact_phase_advance(fodo_ring):
+    coarse = ap.Twiss(fodo_ring, steps_per_element=1)
+    fine = ap.Twiss(fodo_ring, steps_per_element=50)
+    assert math.isclose(coarse.tune_x, fine.tune_x, rel_tol=1e-12)
+    assert math.isclose(coarse.tune_y, fine.tune_y, rel_tol=1e-12)
+    # the fractional tune from the one-turn matrix is ambiguous (q or 1 - q)
+    assert math.isclose(1 - coarse.tune_x % 1, coarse.tune_x_fractional)
+    assert np.all(np.diff(fine.psi_x) > 0)
+
+
+def test_analytic_radiation_integrals(fodo_ring):
+    kwargs = dict(energy=1000, radiation_integrals="analytic")
+    coarse = ap.Twiss(fodo_ring, steps_per_element=1, **kwargs)
+    fine = ap.Twiss(fodo_ring, steps_per_element=10, **kwargs)
+    numeric = ap.Twiss(fodo_ring, energy=1000, steps_per_element=1000)
+    for i in range(1, 6):
+        analytic = getattr(coarse, f"i{i}")
+        assert math.isclose(analytic, getattr(fine, f"i{i}"))
+        assert math.isclose(analytic, getattr(numeric, f"i{i}"), rel_tol=2e-2)
+    assert math.isclose(coarse.emittance_x, numeric.emittance_x, rel_tol=1e-3)
+    assert math.isclose(coarse.alpha_c, numeric.alpha_c, rel_tol=1e-3)
+
+    # dipoles without bending angle do not contribute
+    straight = ap.Dipole("B0", length=0.5, angle=0)
+    ring = ap.Lattice("RING", [fodo_ring, straight])
+    analytic = ap.Twiss(ring, steps_per_element=1, **kwargs)
+    numeric = ap.Twiss(ring, energy=1000, steps_per_element=1000)
+    for i in range(1, 6):
+        value = getattr(analytic, f"i{i}")
+        assert math.isclose(value, getattr(numeric, f"i{i}"), rel_tol=2e-2)
+    assert math.isclose(analytic.emittance_x, numeric.emittance_x, rel_tol=1e-3)
+
+
+def test_poleface_effect():
+    drift = ap.Drift("D", length=0.5)
+    qf, qd = ap.Quadrupole("QF", 0.2, k1=1.2), ap.Quadrupole("QD", 0.2, k1=-1.2)
+    b1 = ap.Dipole("B1", length=1.0, angle=np.pi / 16, e1=0.05, e2=0.07)
+    b2 = ap.Dipole("B2", length=0.8, angle=np.pi / 16, e1=0.1, e2=0.02)
+    cell = ap.Lattice("CELL", [qf, drift, b1, drift, qd, drift, b2, drift])
+    ring = ap.Lattice("RING", 16 * [cell])
+    twiss = ap.Twiss(ring, energy=1000, steps_per_element=100)
+
+    # every dipole edge contributes k0 ** 2 * tan(e) * eta_x
+    eta_x, p_effect = twiss.eta_x, 0
+    for dipole in (b1, b2):
+        indices = np.array(twiss.element_indices[dipole]).reshape(-1, 100)
+        entrance, exit_ = eta_x[indices[:, 0]], eta_x[indices[:, -1] + 1]
+        edges = np.tan(dipole.e1) * entrance + np.tan(dipole.e2) * exit_
+        p_effect += dipole.k0 ** 2 * np.sum(edges)
+
+    k0, k1 = twiss.k0, twiss.k1
+    i4 = np.trapz(eta_x[1:] * k0 * (k0 ** 2 + 2 * k1), twiss.s[1:]) - p_effect
+    assert math.isclose(twiss.i4, i4)
+    analytic = ap.Twiss(ring, energy=1000, radiation_integrals="analytic")
+    assert math.isclose(twiss.i4, analytic.i4, rel_tol=1e-2)
+
+
+def test_at(fodo_ring):
+    coarse = ap.Twiss(fodo_ring, steps_per_element=1)
+    fine = ap.Twiss(fodo_ring, steps_per_element=20)
+    # every point of the fine lattice lies inside or at the boundary of an element
+    assert np.allclose(coarse.at(fine.s), fine.twiss_array)
+    assert np.allclose(coarse.at(coarse.s), coarse.twiss_array)
+    with pytest.raises(ValueError):
+        coarse.at([-1.0])
+
+
+def test_position_index(fodo_ring):
+    twiss = ap.Twiss(fodo_ring, steps_per_element=3)
+    s = np.random.default_rng(0).uniform(0, fodo_ring.length, 1000)
+    expected = np.searchsorted(twiss.s, s, side="right") - 1
+    assert np.array_equal(expected, twiss.step_indices(s))
+    assert np.array_equal(twiss.at(s), twiss.at(s, chunk_size=7))
+
+    index = twiss.position_index
+    assert twiss.position_index is index
+    fodo_ring["D1"].length += 0.1
+    assert twiss.position_index is not index
+    s = np.random.default_rng(1).uniform(0, fodo_ring.length, 1000)
+    expected = np.searchsorted(twiss.s, s, side="right") - 1
+    assert np.array_equal(expected, twiss.step_indices(s))
+
+    # many short steps within a bin fall back to a binary search
+    short = [ap.Drift(f"S{i}", length=0.001) for i in range(200)]
+    lattice = ap.Lattice("RING", 20 * [ap.Drift("D", length=50), *short])
+    twiss = ap.Twiss(lattice, steps_per_element=1, initial=np.ones(8))
+    _, _, depth = twiss.position_index
+    assert depth > np.log2(twiss.s.size)
+    s = np.random.default_rng(2).uniform(0, lattice.length, 1000)
+    expected = np.searchsorted(twiss.s, s, side="right") - 1
+    assert np.array_equal(expected, twiss.step_indices(s))
+
+
+def test_element_table(fodo_ring):
+    twiss = ap.Twiss(fodo_ring, steps_per_element=20)
+    table = twiss.element_table()
+    assert table.shape == (len(fodo_ring.sequence),)
+    assert twiss.element_table() is table
+    assert np.allclose(table["length"], [e.length for e in fodo_ring.sequence])
+
+    start = 0
+    for element, row in zip(fodo_ring.sequence, table):
+        end = start + 20
+        beta_x = twiss.beta_x[start : end + 1]
+        assert row["s"] == twiss.s[start]
+        assert row["beta_x_entrance"] == beta_x[0]
+        assert row["beta_x_exit"] == beta_x[-1]
+        assert row["beta_x_max"] == beta_x.max()
+        mean = np.trapz(beta_x, twiss.s[start : end + 1]) / element.length
+        assert math.isclose(row["beta_x_mean"], mean)
+        assert row["psi_y"] == twiss.psi_y[end] - twiss.psi_y[start]
+        start = end
+
+    fodo_ring["Q1"].k1 += 0.1
+    assert twiss.element_table() is not table